@@ -1,6 +1,6 @@
 import os
 
-from flask import Flask
+from flask import Flask, Response, redirect, request, session, url_for
 
 
 def create_app(test_config=None):
@@ -32,24 +32,42 @@ def create_app(test_config=None):
     from . import db
     db.init_app(app)
 
+    from . import cache
+    cache.init_app(app)
+
     from . import auth
     app.register_blueprint(auth.bp)
 
+    # the Steam library is the core of the app and always on
     from . import steam
     app.register_blueprint(steam.bp)
+
+    # optional features are only registered when enabled
+    if app.config.get('ENABLE_SOCIAL', True):
+        from . import social
+        app.register_blueprint(social.bp)
     
-    from . import social
-    app.register_blueprint(social.bp)
+    if app.config.get('ENABLE_RECOMMENDATIONS', True):
+        from . import recommendations
+        app.register_blueprint(recommendations.bp)
     
-    from . import recommendations
-    app.register_blueprint(recommendations.bp)
+    # Epic import pages have no templates yet, so the blueprint is opt-in
+    if app.config.get('ENABLE_EPIC', False):
+        from . import epic
+        app.register_blueprint(epic.bp)
     
+    # Anonymous visitors to / always go to the same login URL, so it is built
+    # once per mount point instead of on every hit from bots and health checks
+    login_urls = {}
+
     # Set root route to library (or login if not authenticated)
     @app.route('/')
     def index():
-        from flask import redirect, url_for, session
         if session.get('user_id'):
             return redirect(url_for('steam.library'))
-        return redirect(url_for('auth.login'))
+        location = login_urls.get(request.script_root)
+        if location is None:
+            location = login_urls[request.script_root] = url_for('auth.login')
+        return Response(status=302, headers={'Location': location, 'Cache-Control': 'private, max-age=0'})
 
     return app
\ No newline at end of file
@@ -0,0 +1,43 @@
+import time
+
+from flask_caching import Cache
+
+cache = Cache()
+
+# How long a user's computed recommendations are reused
+RECOMMENDATIONS_TIMEOUT = 120
+
+# Keys looked up per query, to stay under SQLite's bound-parameter limit
+_LOOKUP_CHUNK = 500
+
+
+def recommendations_key(user_id):
+    """Cache key for a user's recommendations; delete it when their inputs change."""
+    return f'recommendations/{user_id}'
+
+
+def load_cached_rows(db, table, key_column, value_column, keys, ttl, miss_ttl):
+    """
+    Look up API responses saved in a cache table from schema_upgrade.sql.
+    Returns dict mapping key to value_column for entries younger than ttl.
+    A NULL value_column marks a failed lookup, which only counts for
+    miss_ttl so a transient error can recover.
+    """
+    now = int(time.time())
+    cached = {}
+    for start in range(0, len(keys), _LOOKUP_CHUNK):
+        chunk = keys[start:start + _LOOKUP_CHUNK]
+        rows = db.execute(
+            f'SELECT {key_column}, {value_column} FROM {table}'
+            f' WHERE {key_column} IN ({",".join("?" * len(chunk))})'
+            f' AND fetched_at > ? - CASE WHEN {value_column} IS NULL THEN ? ELSE ? END',
+            (*chunk, now, miss_ttl, ttl)
+        ).fetchall()
+        cached.update((row[0], row[1]) for row in rows)
+    return cached
+
+
+def init_app(app):
+    app.config.setdefault('CACHE_TYPE', 'SimpleCache')
+    app.config.setdefault('CACHE_DEFAULT_TIMEOUT', 60)
+    cache.init_app(app)
@@ -2,16 +2,18 @@ import sqlite3
 from datetime import datetime
 
 import click
-from flask import current_app, g
+from flask import current_app, g, has_request_context, request
+
+from flaskr.db_pool import get_pool
+
+# Requests with these methods get a read-only connection from the pool
+READ_ONLY_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
 
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        read_only = has_request_context() and request.method in READ_ONLY_METHODS
+        g.db = get_pool(current_app).acquire(read_only)
 
     return g.db
 
@@ -20,13 +22,15 @@ def close_db(e=None):
     db = g.pop('db', None)
 
     if db is not None:
-        db.close()
+        get_pool(current_app).release(db)
 
 def init_db():
     db = get_db()
 
     with current_app.open_resource('schema.sql') as f:
         db.executescript(f.read().decode('utf8'))
+    with current_app.open_resource('schema_upgrade.sql') as f:
+        db.executescript(f.read().decode('utf8'))
 
 
 @click.command('init-db')
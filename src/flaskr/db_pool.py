@@ -0,0 +1,112 @@
+import math
+import queue
+import sqlite3
+import threading
+
+# Applied to every new connection. WAL lets readers proceed while an import
+# writes, and synchronous=NORMAL is durable enough in WAL mode with fewer fsyncs.
+# mmap_size and cache_size (negative means KiB) keep hot pages out of read().
+CONNECTION_PRAGMAS = (
+    'journal_mode=WAL',
+    'synchronous=NORMAL',
+    'temp_store=MEMORY',
+    'mmap_size=268435456',
+    'cache_size=-65536',
+    'foreign_keys=ON',
+)
+
+_POOL_LOCK = threading.Lock()
+
+
+def relevance(my_playtime, their_playtime):
+    """
+    Relevance of a common game = geometric mean (balanced playtime) * log(total + 1).
+    This favors games where both users have significant playtime
+    while still rewarding higher total playtime.
+    Registered on every connection so common games can be sorted in SQL.
+    """
+    my_playtime = my_playtime or 0
+    their_playtime = their_playtime or 0
+    if my_playtime > 0 and their_playtime > 0:
+        return math.sqrt(my_playtime * their_playtime) * math.log(my_playtime + their_playtime + 1)
+    return 0
+
+
+def connect(database):
+    """Open a connection configured the same way as pooled connections."""
+    conn = sqlite3.connect(
+        database,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        # Queries live in module-level _SQL_* constants (or prebuilt dicts of
+        # them), so the SQL text repeats exactly and these prepared statements
+        # are reused for as long as the pooled connection lives
+        cached_statements=256,
+        check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(f'PRAGMA {pragma}')
+    # Registered once per connection: redefining a function later expires
+    # every cached statement on the connection
+    conn.create_function('relevance', 2, relevance, deterministic=True)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Reusable SQLite connections for one database file.
+    Connections are handed out most-recently-used first so their page cache
+    and statement cache stay warm; at most size idle connections are kept.
+    Any connection not lent read-only may write. There is no app-level writer
+    lock: SQLite already serialises writers, and a lock held for a whole
+    request would block everyone while an import waits on the Steam API.
+    """
+
+    def __init__(self, database, size=8):
+        self.database = database
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self, read_only=False):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = connect(self.database)
+        # query_only makes SQLite reject writes on connections lent for reads
+        conn.execute(f'PRAGMA query_only = {int(read_only)}')
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def get_pool(app):
+    """Return the app's connection pool, creating it on first use."""
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        with _POOL_LOCK:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                pool = ConnectionPool(
+                    app.config['DATABASE'], app.config.get('DATABASE_POOL_SIZE', 8)
+                )
+                # Add indexes and cache tables missing from databases made by an
+                # older schema; a new, empty database gets them from init-db
+                conn = pool.acquire()
+                if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'game'").fetchone():
+                    with app.open_resource('schema_upgrade.sql') as f:
+                        conn.executescript(f.read().decode('utf8'))
+                pool.release(conn)
+                app.extensions['db_pool'] = pool
+    return pool
@@ -1,17 +1,104 @@
 import random
 import requests
+import atexit
 import base64
+import hashlib
 import json
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, session, url_for
+    Blueprint, flash, g, redirect, render_template, request, session, url_for, current_app
 )
 
 from flaskr.auth import login_required
+from flaskr.cache import cache, load_cached_rows, recommendations_key
 from flaskr.db import get_db
 
+try:
+    # orjson parses large pasted manifests several times faster than json
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
+
 bp = Blueprint('epic', __name__, url_prefix='/epic')
 
+# Number of catalog lookups run concurrently, and how long to wait for them
+_FETCH_WORKERS = 16
+_FETCH_TIMEOUT = 15
+
+# Catalog data rarely changes; failed lookups are retried much sooner
+_CATALOG_CACHE_TTL = 7 * 24 * 60 * 60
+_CATALOG_MISS_TTL = 60 * 60
+
+# Shared session so repeated Epic API calls reuse pooled keep-alive connections
+# instead of paying a fresh TCP+TLS handshake per request. The per-host pool is
+# sized to the prefetch workers so every in-flight lookup keeps its connection.
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=_FETCH_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+))
+# Ask for every content encoding urllib3 can decode here (br when brotli is installed)
+_SESSION.headers.update({'Accept': 'application/json'})
+_SESSION.headers.update(make_headers(accept_encoding=True))
+
+# Long-lived pool for catalog lookups so imports don't pay thread start-up each time
+_EXECUTOR = ThreadPoolExecutor(max_workers=_FETCH_WORKERS, thread_name_prefix='epic-io')
+atexit.register(_EXECUTOR.shutdown, wait=False)
+# Image enrichment jobs wait on _EXECUTOR lookups, so they get their own pool
+# rather than queueing behind (and starving) the lookups they wait for
+_ENRICH_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='epic-enrich')
+atexit.register(_ENRICH_EXECUTOR.shutdown, wait=False)
+
+# OAuth access tokens keyed by a hash of the client credentials, mapped to
+# (access_token, expires_at) where expires_at is on the time.monotonic() clock.
+_TOKEN_CACHE = {}
+_TOKEN_LOCK = threading.Lock()
+
+# Manifest parsing: "key": "value" pairs in plain text whose key looks like a
+# game name (but not an ID such as "AppId"), and the key aliases different
+# launcher exports use for each field.
+_NAME_PAIR_RE = re.compile(r'"(?![^"]*id")([^"]*(?:name|title|app)[^"]*)"\s*:\s*"([^"]+)"', re.IGNORECASE)
+_NAME_KEYS = ('AppName', 'DisplayName', 'name', 'title')
+_ID_KEYS = ('AppId', 'AppID', 'appId', 'id')
+_NS_KEYS = ('Namespace', 'namespace')
+_OFFER_KEYS = ('OfferId', 'offerId')
+_IMAGE_KEYS = ('OfferImageWide', 'image')
+_JSON_OPENERS = ('{', '[')
+_JSON_BYTE_OPENERS = (b'{', b'[')
+
+# Fallback appid slug for games without an offer ID: one pass instead of chained replace()
+_SLUG_TABLE = str.maketrans({' ': '-', '/': '-', ':': None})
+
+# Epic catalog offer IDs are 32 lowercase hex characters
+_OFFER_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_SQL_CACHE_DETAILS = (
+    'INSERT OR REPLACE INTO epic_catalog_cache (offer_id, json, fetched_at) VALUES (?, ?, ?)'
+)
+# Multi-row game upsert, completed with one "(?, ?, 'epic', 0, '', ?)" per game
+_SQL_UPSERT_GAMES_PREFIX = (
+    'INSERT INTO game (appid, name, platform, playtime_forever, img_icon_url, img_logo_url) VALUES '
+)
+_SQL_UPSERT_GAMES_SUFFIX = (
+    ' ON CONFLICT (appid) DO UPDATE SET name = excluded.name,'
+    " img_logo_url = COALESCE(NULLIF(excluded.img_logo_url, ''), img_logo_url)"
+    ' WHERE platform = excluded.platform'
+    ' RETURNING id'
+)
+# Games per lookup or upsert statement (3 parameters each), under SQLite's parameter limit
+_UPSERT_CHUNK = 500
+_SQL_UPSERT_LIBRARY = (
+    'INSERT INTO user_game_library (user_id, game_id, playtime_forever) VALUES (?, ?, 0)'
+    ' ON CONFLICT (user_id, game_id) DO UPDATE SET imported_at = CURRENT_TIMESTAMP'
+)
+
 
 def get_epic_api_credentials():
     """Get Epic Games API credentials from config or environment variables."""
@@ -24,9 +111,23 @@ def get_epic_api_credentials():
     }
 
 
+def _token_cache_key(credentials):
+    """Hash the credentials so raw client secrets aren't kept as dict keys."""
+    raw = f"{credentials['client_id']}:{credentials['client_secret']}:{credentials['deployment_id']}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def invalidate_epic_access_token():
+    """Drop the cached access token for the configured credentials."""
+    key = _token_cache_key(get_epic_api_credentials())
+    with _TOKEN_LOCK:
+        _TOKEN_CACHE.pop(key, None)
+
+
 def get_epic_access_token():
     """
     Get OAuth access token from Epic Games using client credentials flow.
+    Tokens are cached until shortly before they expire.
     Returns access token or None if error.
     """
     credentials = get_epic_api_credentials()
@@ -34,6 +135,12 @@ def get_epic_access_token():
     if not credentials['client_id'] or not credentials['client_secret']:
         return None, 'Epic Games API credentials not configured. Please set EPIC_CLIENT_ID and EPIC_CLIENT_SECRET.'
     
+    key = _token_cache_key(credentials)
+    with _TOKEN_LOCK:
+        cached = _TOKEN_CACHE.get(key)
+    if cached and cached[1] - time.monotonic() > 30:
+        return cached[0], None
+    
     try:
         # Epic Games OAuth token endpoint
         url = "https://api.epicgames.dev/epic/oauth/v2/token"
@@ -52,16 +159,41 @@ def get_epic_access_token():
             'deployment_id': credentials['deployment_id']
         }
         
-        response = requests.post(url, headers=headers, data=data, timeout=10)
+        response = _SESSION.post(url, headers=headers, data=data, timeout=10)
         response.raise_for_status()
         
         token_data = response.json()
-        return token_data.get('access_token'), None
+        access_token = token_data.get('access_token')
+        if access_token:
+            # Refresh a minute early so a token never expires mid-import
+            expires_in = int(token_data.get('expires_in') or 0)
+            with _TOKEN_LOCK:
+                _TOKEN_CACHE[key] = (access_token, time.monotonic() + expires_in - 60)
+        return access_token, None
         
     except requests.RequestException as e:
         return None, f'Error getting Epic Games access token: {str(e)}'
 
 
+def _get_epic_entitlements(account_id, access_token):
+    """Request the raw entitlements payload, raising on HTTP errors."""
+    # Epic Games Ecom API endpoint for user entitlements
+    url = f"https://api.epicgames.dev/epic/ecom/v1/accounts/{account_id}/entitlements"
+    
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+    
+    params = {
+        'includeRedeemed': True
+    }
+    
+    response = _SESSION.get(url, headers=headers, params=params, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+
 def fetch_epic_library(account_id, access_token):
     """
     Fetch user's Epic Games library using Epic Games Ecom API.
@@ -71,22 +203,17 @@ def fetch_epic_library(account_id, access_token):
         return None, 'No access token available.'
     
     try:
-        # Epic Games Ecom API endpoint for user entitlements
-        url = f"https://api.epicgames.dev/epic/ecom/v1/accounts/{account_id}/entitlements"
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        params = {
-            'includeRedeemed': True
-        }
-        
-        response = requests.get(url, headers=headers, params=params, timeout=10)
-        response.raise_for_status()
-        
-        data = response.json()
+        try:
+            data = _get_epic_entitlements(account_id, access_token)
+        except requests.HTTPError as e:
+            if e.response.status_code != 401:
+                raise
+            # The cached token may have been revoked early; refetch and retry once
+            invalidate_epic_access_token()
+            access_token, token_error = get_epic_access_token()
+            if token_error:
+                return None, token_error
+            data = _get_epic_entitlements(account_id, access_token)
         
         # Parse entitlements into game list
         games = []
@@ -112,15 +239,15 @@ def fetch_epic_library(account_id, access_token):
         return None, f'Error connecting to Epic Games API: {str(e)}'
 
 
-def get_epic_game_details(offer_id):
+def get_epic_game_details(offer_id, namespace='fn'):
     """
     Get game details from Epic Games Store API.
     Returns game info dict or None.
     """
     try:
         # Epic Games catalog API
-        url = f"https://catalog-public-service-prod.ol.epicgames.com/catalog/api/shared/namespace/fn/items/{offer_id}"
-        response = requests.get(url, timeout=10)
+        url = f"https://catalog-public-service-prod.ol.epicgames.com/catalog/api/shared/namespace/{namespace}/items/{offer_id}"
+        response = _SESSION.get(url, timeout=10)
         
         if response.status_code == 200:
             return response.json()
@@ -130,88 +257,253 @@ def get_epic_game_details(offer_id):
         return None
 
 
+def _wide_image_url(details):
+    """Return the OfferImageWide URL from catalog details, or ''."""
+    return next(
+        (img.get('url', '') for img in (details or {}).get('keyImages', ()) if img.get('type') == 'OfferImageWide'),
+        ''
+    )
+
+
+def _load_cached_game_details(db, offer_ids):
+    """
+    Look up catalog details saved by earlier imports.
+    Returns dict mapping offer_id to details (or None) for fresh cache entries.
+    """
+    cached = load_cached_rows(
+        db, 'epic_catalog_cache', 'offer_id', 'json', offer_ids, _CATALOG_CACHE_TTL, _CATALOG_MISS_TTL
+    )
+    return {
+        offer_id: _json_loads(details) if details is not None else None
+        for offer_id, details in cached.items()
+    }
+
+
+def _fetch_game_details(lookups):
+    """
+    Fetch catalog details for several offers concurrently.
+    lookups is a list of (offer_id, namespace) tuples.
+    Returns dict mapping offer_id to details (or None) for lookups that
+    finished before the deadline.
+    """
+    futures = {
+        _EXECUTOR.submit(get_epic_game_details, offer_id, namespace or 'fn'): offer_id
+        for offer_id, namespace in lookups
+    }
+    done, not_done = wait(futures, timeout=_FETCH_TIMEOUT)
+    # Lookups still pending are dropped and retried on the next import
+    for future in not_done:
+        future.cancel()
+    return {futures[future]: future.result() for future in done}
+
+
+def _enrich_images_background(app, lookups):
+    """
+    Background function to fill in catalog images for imported games.
+    Runs on _ENRICH_EXECUTOR so the import can respond immediately.
+    """
+    with app.app_context():
+        try:
+            fetched = _fetch_game_details(lookups)
+            if not fetched:
+                return
+            
+            db = get_db()
+            now = int(time.time())
+            db.executemany(
+                _SQL_CACHE_DETAILS,
+                [(offer_id, json.dumps(details) if details is not None else None, now)
+                 for offer_id, details in fetched.items()]
+            )
+            db.executemany(
+                "UPDATE game SET img_logo_url = ? WHERE appid = ? AND platform = 'epic'",
+                [(img_url, offer_id) for offer_id, img_url in
+                 ((offer_id, _wide_image_url(details)) for offer_id, details in fetched.items()) if img_url]
+            )
+            db.commit()
+        except Exception as e:
+            # The executor would otherwise swallow the error silently
+            print(f"Error enriching Epic game images: {e}")
+
+
+def _parse_manual_games(manual_games):
+    """
+    Parse manually entered games, one per line.
+    Format: "Game Name|offer-id" or just "Game Name".
+    Returns list of game dicts.
+    """
+    entries = []
+    for line in manual_games.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        
+        parts = line.split('|')
+        game_name = parts[0].strip()
+        offer_id = parts[1].strip() if len(parts) > 1 else None
+        
+        if game_name:
+            entries.append({'name': game_name, 'offer_id': offer_id, 'app_id': None, 'namespace': None})
+    return entries
+
+
+def _upsert_epic_games(db, user_id, game_rows):
+    """
+    Insert or update Epic games and add them to the user's library in bulk.
+    game_rows is a list of (appid, name, img_url) tuples.
+    Returns (imported_count, updated_count) tuple.
+    """
+    if not game_rows:
+        return 0, 0
+    
+    appids = list(dict.fromkeys(appid for appid, _, _ in game_rows))
+    
+    # Lookups and upserts go in chunks to stay under SQLite's bound-parameter limit
+    existing = set()
+    for start in range(0, len(appids), _UPSERT_CHUNK):
+        chunk = appids[start:start + _UPSERT_CHUNK]
+        existing.update(row['appid'] for row in db.execute(
+            f"SELECT appid FROM game WHERE appid IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall())
+    imported_count = len(appids) - len(existing)
+    
+    # RETURNING yields the id of every game inserted or updated as Epic
+    game_ids = set()
+    for start in range(0, len(game_rows), _UPSERT_CHUNK):
+        chunk = game_rows[start:start + _UPSERT_CHUNK]
+        game_ids.update(row['id'] for row in db.execute(
+            _SQL_UPSERT_GAMES_PREFIX + ','.join(["(?, ?, 'epic', 0, '', ?)"] * len(chunk)) + _SQL_UPSERT_GAMES_SUFFIX,
+            [value for row in chunk for value in row]
+        ).fetchall())
+    
+    db.executemany(_SQL_UPSERT_LIBRARY, [(user_id, game_id) for game_id in game_ids])
+    
+    return imported_count, len(game_rows) - imported_count
+
+
+def _persist_games(games, user_id):
+    """
+    Save Epic games to the database and the user's library.
+    Catalog images that aren't cached yet are filled in in the background.
+    games is a list of dicts with 'name', 'offer_id', 'app_id' and
+    optionally 'namespace' and 'image_url' keys.
+    Returns (imported_count, updated_count) tuple.
+    """
+    # Only ask the catalog about real offer IDs we don't already have an image for.
+    # Entitlements often repeat the same offer, so each is looked up once.
+    lookups = {}
+    for game_data in games:
+        offer_id = game_data.get('offer_id') or game_data.get('app_id')
+        if offer_id and not game_data.get('image_url') and _OFFER_ID_RE.match(offer_id):
+            lookups.setdefault(offer_id, game_data.get('namespace'))
+    
+    db = get_db()
+    details_map = _load_cached_game_details(db, list(lookups)) if lookups else {}
+    
+    game_rows = []
+    for game_data in games:
+        game_name = game_data.get('name') or 'Unknown Game'
+        offer_id = game_data.get('offer_id') or game_data.get('app_id')
+        appid = offer_id if offer_id else f"epic-{game_name.lower().translate(_SLUG_TABLE)}"
+        
+        # Prefer an image from the import itself, then the Epic Games catalog
+        img_url = game_data.get('image_url') or _wide_image_url(details_map.get(offer_id))
+        
+        game_rows.append((appid, game_name, img_url))
+    
+    # Write the whole import in one transaction so it costs a single sync at commit
+    db.execute('BEGIN IMMEDIATE')
+    counts = _upsert_epic_games(db, user_id, game_rows)
+    db.commit()
+    cache.delete(recommendations_key(user_id))
+    
+    # Images not in the catalog cache are fetched after responding
+    missing = [(offer_id, namespace) for offer_id, namespace in lookups.items() if offer_id not in details_map]
+    if missing:
+        _ENRICH_EXECUTOR.submit(_enrich_images_background, current_app._get_current_object(), missing)
+    return counts
+
+
+def _first(item, keys):
+    """Return the first truthy value among keys in item, or None."""
+    return next((item[key] for key in keys if item.get(key)), None)
+
+
+def _manifest_game(item):
+    """Build a game dict from a manifest entry, or None if it has no name."""
+    game_name = _first(item, _NAME_KEYS)
+    if not game_name:
+        return None
+    
+    # Exports sometimes give numeric ids; appids are stored as text
+    app_id = _first(item, _ID_KEYS)
+    app_id = str(app_id) if app_id is not None else None
+    offer_id = _first(item, _OFFER_KEYS)
+    image_url = _first(item, _IMAGE_KEYS)
+    return {
+        'name': game_name,
+        'app_id': app_id,
+        'namespace': _first(item, _NS_KEYS),
+        'offer_id': str(offer_id) if offer_id is not None else app_id,
+        'image_url': _wide_image_url(item) or (image_url if isinstance(image_url, str) else None)
+    }
+
+
+def _parse_manifest_text(manifest_text):
+    """Extract game names from "key": "value" pairs in plain text."""
+    games = []
+    for line in manifest_text.split('\n'):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            # Try to extract JSON-like structures
+            for match in _NAME_PAIR_RE.finditer(line):
+                games.append({'name': match.group(2), 'app_id': None, 'namespace': None, 'offer_id': None})
+    return games if games else None
+
+
 def parse_epic_manifest(manifest_data):
     """
     Parse Epic Games launcher manifest data.
     Epic Games stores library data in JSON format.
     Returns list of games or None if error.
     """
-    try:
-        # Try to parse as JSON
-        if isinstance(manifest_data, str):
-            data = json.loads(manifest_data)
-        else:
-            data = manifest_data
-        
-        games = []
+    if isinstance(manifest_data, (str, bytes, bytearray)):
+        # Only attempt a JSON parse when the data opens an array or object, so
+        # plain-text lists don't pay for building a decode error first
+        data = None
+        openers = _JSON_OPENERS if isinstance(manifest_data, str) else _JSON_BYTE_OPENERS
+        if manifest_data.lstrip()[:1] in openers:
+            try:
+                data = _json_loads(manifest_data)
+            except json.JSONDecodeError:
+                pass
         
+        if data is None:
+            # Not JSON, try to extract game names from plain text
+            if not isinstance(manifest_data, str):
+                manifest_data = manifest_data.decode('utf-8', errors='replace')
+            return _parse_manifest_text(manifest_data)
+    else:
+        data = manifest_data
+    
+    try:
         # Handle different manifest formats
         # Format 1: Array of game objects
         if isinstance(data, list):
-            for item in data:
-                if isinstance(item, dict):
-                    game_name = item.get('AppName') or item.get('DisplayName') or item.get('name') or item.get('title')
-                    app_id = item.get('AppId') or item.get('AppID') or item.get('appId') or item.get('id')
-                    namespace = item.get('Namespace') or item.get('namespace')
-                    
-                    if game_name:
-                        games.append({
-                            'name': game_name,
-                            'app_id': app_id,
-                            'namespace': namespace,
-                            'offer_id': item.get('OfferId') or item.get('offerId') or app_id
-                        })
-        
+            items = data
         # Format 2: Object with games array
         elif isinstance(data, dict):
             # Check for common keys
-            games_list = data.get('games') or data.get('Items') or data.get('items') or data.get('library')
-            
-            if games_list:
-                for item in games_list:
-                    if isinstance(item, dict):
-                        game_name = item.get('AppName') or item.get('DisplayName') or item.get('name') or item.get('title')
-                        app_id = item.get('AppId') or item.get('AppID') or item.get('appId') or item.get('id')
-                        namespace = item.get('Namespace') or item.get('namespace')
-                        
-                        if game_name:
-                            games.append({
-                                'name': game_name,
-                                'app_id': app_id,
-                                'namespace': namespace,
-                                'offer_id': item.get('OfferId') or item.get('offerId') or app_id
-                            })
-            else:
+            items = data.get('games') or data.get('Items') or data.get('items') or data.get('library')
+            if not items:
                 # Try to extract games from any nested structure
-                for key, value in data.items():
-                    if isinstance(value, list):
-                        for item in value:
-                            if isinstance(item, dict):
-                                game_name = item.get('AppName') or item.get('DisplayName') or item.get('name') or item.get('title')
-                                if game_name:
-                                    games.append({
-                                        'name': game_name,
-                                        'app_id': item.get('AppId') or item.get('AppID') or item.get('appId') or item.get('id'),
-                                        'namespace': item.get('Namespace') or item.get('namespace'),
-                                        'offer_id': item.get('OfferId') or item.get('offerId')
-                                    })
+                items = [item for value in data.values() if isinstance(value, list) for item in value]
+        else:
+            items = []
         
+        games = [game for game in (_manifest_game(item) for item in items if isinstance(item, dict)) if game]
         return games if games else None
         
-    except json.JSONDecodeError:
-        # Try to extract game names from plain text
-        games = []
-        lines = manifest_data.split('\n') if isinstance(manifest_data, str) else []
-        for line in lines:
-            line = line.strip()
-            if line and not line.startswith('#'):
-                # Try to extract JSON-like structures
-                match = re.search(r'"([^"]+)"\s*:\s*"([^"]+)"', line)
-                if match:
-                    key, value = match.groups()
-                    if 'name' in key.lower() or 'title' in key.lower() or 'app' in key.lower():
-                        games.append({'name': value, 'app_id': None, 'namespace': None, 'offer_id': None})
-        return games if games else None
     except Exception as e:
         print(f"Error parsing Epic manifest: {e}")
         return None
@@ -235,60 +527,7 @@ def import_manifest():
             if not games:
                 error = 'Could not parse Epic Games library data. Please check the format and try again.'
             else:
-                db = get_db()
-                imported_count = 0
-                updated_count = 0
-                
-                for game_data in games:
-                    game_name = game_data.get('name')
-                    offer_id = game_data.get('offer_id') or game_data.get('app_id')
-                    appid = offer_id if offer_id else f"epic-{game_name.lower().replace(' ', '-').replace(':', '').replace('/', '-')}"
-                    
-                    # Try to get game image
-                    img_url = ''
-                    if offer_id:
-                        game_details = get_epic_game_details(offer_id)
-                        if game_details and 'keyImages' in game_details:
-                            for img in game_details['keyImages']:
-                                if img.get('type') == 'OfferImageWide':
-                                    img_url = img.get('url', '')
-                                    break
-                    
-                    # Insert or update game
-                    try:
-                        db.execute(
-                            'INSERT INTO game (appid, name, platform, playtime_forever, img_icon_url, img_logo_url)'
-                            ' VALUES (?, ?, ?, ?, ?, ?)',
-                            (appid, game_name, 'epic', 0, '', img_url)
-                        )
-                        imported_count += 1
-                    except db.IntegrityError:
-                        db.execute(
-                            'UPDATE game SET name = ?, img_logo_url = ? WHERE appid = ? AND platform = ?',
-                            (game_name, img_url, appid, 'epic')
-                        )
-                        updated_count += 1
-                    
-                    # Get game ID
-                    game = db.execute(
-                        'SELECT id FROM game WHERE appid = ? AND platform = ?', (appid, 'epic')
-                    ).fetchone()
-                    
-                    if game:
-                        try:
-                            db.execute(
-                                'INSERT INTO user_game_library (user_id, game_id, playtime_forever)'
-                                ' VALUES (?, ?, ?)',
-                                (g.user['id'], game['id'], 0)
-                            )
-                        except db.IntegrityError:
-                            db.execute(
-                                'UPDATE user_game_library SET imported_at = CURRENT_TIMESTAMP'
-                                ' WHERE user_id = ? AND game_id = ?',
-                                (g.user['id'], game['id'])
-                            )
-                
-                db.commit()
+                imported_count, updated_count = _persist_games(games, g.user['id'])
                 flash(f'Successfully imported {imported_count} new games and updated {updated_count} existing games!')
                 return redirect(url_for('steam.library'))
         
@@ -325,134 +564,13 @@ def import_library():
                     error = 'No games found in your Epic Games library.'
                 
                 if error is None:
-                    db = get_db()
-                    imported_count = 0
-                    updated_count = 0
-                    
-                    for game_data in games:
-                        offer_id = game_data.get('offer_id')
-                        game_name = game_data.get('name', 'Unknown Game')
-                        appid = offer_id or f"epic-{game_data.get('id', 'unknown')}"
-                        
-                        # Try to get game image from catalog
-                        img_url = ''
-                        if offer_id:
-                            game_details = get_epic_game_details(offer_id)
-                            if game_details and 'keyImages' in game_details:
-                                for img in game_details['keyImages']:
-                                    if img.get('type') == 'OfferImageWide':
-                                        img_url = img.get('url', '')
-                                        break
-                        
-                        # Insert or update game
-                        try:
-                            db.execute(
-                                'INSERT INTO game (appid, name, platform, playtime_forever, img_icon_url, img_logo_url)'
-                                ' VALUES (?, ?, ?, ?, ?, ?)',
-                                (appid, game_name, 'epic', 0, '', img_url)
-                            )
-                            imported_count += 1
-                        except db.IntegrityError:
-                            # Game already exists, update it
-                            db.execute(
-                                'UPDATE game SET name = ?, img_logo_url = ? WHERE appid = ? AND platform = ?',
-                                (game_name, img_url, appid, 'epic')
-                            )
-                            updated_count += 1
-                        
-                        # Get game ID
-                        game = db.execute(
-                            'SELECT id FROM game WHERE appid = ? AND platform = ?', (appid, 'epic')
-                        ).fetchone()
-                        
-                        if game:
-                            # Insert or update user_game_library
-                            try:
-                                db.execute(
-                                    'INSERT INTO user_game_library (user_id, game_id, playtime_forever)'
-                                    ' VALUES (?, ?, ?)',
-                                    (g.user['id'], game['id'], 0)
-                                )
-                            except db.IntegrityError:
-                                # Already in library, update
-                                db.execute(
-                                    'UPDATE user_game_library SET imported_at = CURRENT_TIMESTAMP'
-                                    ' WHERE user_id = ? AND game_id = ?',
-                                    (g.user['id'], game['id'])
-                                )
-                    
-                    db.commit()
+                    imported_count, updated_count = _persist_games(games, g.user['id'])
                     flash(f'Successfully imported {imported_count} new games and updated {updated_count} existing games from Epic Games!')
                     return redirect(url_for('steam.library'))
         
         # Fall back to manual entry
         elif manual_games:
-            db = get_db()
-            imported_count = 0
-            updated_count = 0
-            
-            for line in manual_games.split('\n'):
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Parse format: "Game Name|offer-id" or just "Game Name"
-                parts = line.split('|')
-                game_name = parts[0].strip()
-                offer_id = parts[1].strip() if len(parts) > 1 else None
-                
-                if game_name:
-                    # Create unique appid
-                    appid = offer_id if offer_id else f"epic-{game_name.lower().replace(' ', '-').replace(':', '').replace('/', '-')}"
-                    
-                    # Try to get game image from Epic Games catalog
-                    img_url = ''
-                    if offer_id:
-                        game_details = get_epic_game_details(offer_id)
-                        if game_details and 'keyImages' in game_details:
-                            for img in game_details['keyImages']:
-                                if img.get('type') == 'OfferImageWide':
-                                    img_url = img.get('url', '')
-                                    break
-                    
-                    # Insert or update game
-                    try:
-                        db.execute(
-                            'INSERT INTO game (appid, name, platform, playtime_forever, img_icon_url, img_logo_url)'
-                            ' VALUES (?, ?, ?, ?, ?, ?)',
-                            (appid, game_name, 'epic', 0, '', img_url)
-                        )
-                        imported_count += 1
-                    except db.IntegrityError:
-                        # Game already exists, update it
-                        db.execute(
-                            'UPDATE game SET name = ?, img_logo_url = ? WHERE appid = ? AND platform = ?',
-                            (game_name, img_url, appid, 'epic')
-                        )
-                        updated_count += 1
-                    
-                    # Get game ID
-                    game = db.execute(
-                        'SELECT id FROM game WHERE appid = ? AND platform = ?', (appid, 'epic')
-                    ).fetchone()
-                    
-                    if game:
-                        # Insert or update user_game_library
-                        try:
-                            db.execute(
-                                'INSERT INTO user_game_library (user_id, game_id, playtime_forever)'
-                                ' VALUES (?, ?, ?)',
-                                (g.user['id'], game['id'], 0)
-                            )
-                        except db.IntegrityError:
-                            # Already in library, update
-                            db.execute(
-                                'UPDATE user_game_library SET imported_at = CURRENT_TIMESTAMP'
-                                ' WHERE user_id = ? AND game_id = ?',
-                                (g.user['id'], game['id'])
-                            )
-            
-            db.commit()
+            imported_count, updated_count = _persist_games(_parse_manual_games(manual_games), g.user['id'])
             flash(f'Successfully imported {imported_count} new games and updated {updated_count} existing games!')
             return redirect(url_for('steam.library'))
         else:
@@ -480,76 +598,10 @@ def manual_import():
             error = 'Please enter at least one game.'
         
         if error is None:
-            db = get_db()
-            imported_count = 0
-            updated_count = 0
-            
-            for line in manual_games.split('\n'):
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # Parse format: "Game Name|offer-id" or just "Game Name"
-                parts = line.split('|')
-                game_name = parts[0].strip()
-                offer_id = parts[1].strip() if len(parts) > 1 else None
-                
-                if game_name:
-                    # Create unique appid
-                    appid = offer_id if offer_id else f"epic-{game_name.lower().replace(' ', '-').replace(':', '')}"
-                    
-                    # Try to get game image from Epic Games catalog
-                    img_url = ''
-                    if offer_id:
-                        game_details = get_epic_game_details(offer_id)
-                        if game_details and 'keyImages' in game_details:
-                            for img in game_details['keyImages']:
-                                if img.get('type') == 'OfferImageWide':
-                                    img_url = img.get('url', '')
-                                    break
-                    
-                    # Insert or update game
-                    try:
-                        db.execute(
-                            'INSERT INTO game (appid, name, platform, playtime_forever, img_icon_url, img_logo_url)'
-                            ' VALUES (?, ?, ?, ?, ?, ?)',
-                            (appid, game_name, 'epic', 0, '', img_url)
-                        )
-                        imported_count += 1
-                    except db.IntegrityError:
-                        # Game already exists, update it
-                        db.execute(
-                            'UPDATE game SET name = ?, img_logo_url = ? WHERE appid = ? AND platform = ?',
-                            (game_name, img_url, appid, 'epic')
-                        )
-                        updated_count += 1
-                    
-                    # Get game ID
-                    game = db.execute(
-                        'SELECT id FROM game WHERE appid = ? AND platform = ?', (appid, 'epic')
-                    ).fetchone()
-                    
-                    if game:
-                        # Insert or update user_game_library
-                        try:
-                            db.execute(
-                                'INSERT INTO user_game_library (user_id, game_id, playtime_forever)'
-                                ' VALUES (?, ?, ?)',
-                                (g.user['id'], game['id'], 0)
-                            )
-                        except db.IntegrityError:
-                            # Already in library, update
-                            db.execute(
-                                'UPDATE user_game_library SET imported_at = CURRENT_TIMESTAMP'
-                                ' WHERE user_id = ? AND game_id = ?',
-                                (g.user['id'], game['id'])
-                            )
-            
-            db.commit()
+            imported_count, updated_count = _persist_games(_parse_manual_games(manual_games), g.user['id'])
             flash(f'Successfully imported {imported_count} new games and updated {updated_count} existing games!')
             return redirect(url_for('steam.library'))
         
         flash(error)
     
-    return render_template('epic/manual_import.html')
-
+    return render_template('epic/manual_import.html')
\ No newline at end of file
@@ -1,134 +1,111 @@
+import heapq
+from operator import itemgetter
+
 from flask import (
     Blueprint, flash, g, redirect, render_template, request, url_for
 )
 
 from flaskr.auth import login_required
+from flaskr.cache import RECOMMENDATIONS_TIMEOUT, cache, recommendations_key
 from flaskr.db import get_db
+from flaskr.tags import POPULAR_TAGS, POPULAR_TAGS_SET
 
 bp = Blueprint('recommendations', __name__, url_prefix='/recommendations')
 
-
-# Common game tags/genres
-POPULAR_TAGS = [
-    'Action', 'Adventure', 'RPG', 'Strategy', 'Simulation', 'Sports',
-    'Racing', 'Puzzle', 'Indie', 'Casual', 'Multiplayer', 'Singleplayer',
-    'FPS', 'Horror', 'Sci-Fi', 'Fantasy', 'Open World', 'Story Rich',
-    'Co-op', 'Competitive', 'Sandbox', 'Survival', 'Crafting', 'Building'
-]
+_SQL_HAS_PREFERENCES = 'SELECT EXISTS (SELECT 1 FROM user_preferences WHERE user_id = ?)'
+# Candidate rows: one per (game, matching tag) plus a row with a NULL tag for
+# each game played by a followed user, excluding games the user owns.
+_SQL_CANDIDATES = (
+    'SELECT g.id, g.name, g.appid, g.img_logo_url, match.tag, match.weight'
+    ' FROM ('
+    '  SELECT gt.game_id, gt.tag, up.weight'
+    '  FROM game_tag gt'
+    '  JOIN user_preferences up ON up.tag = gt.tag AND up.user_id = ?'
+    '  UNION ALL'
+    '  SELECT DISTINCT ugl.game_id, NULL, NULL'
+    '  FROM user_game_library ugl'
+    '  WHERE ugl.user_id IN (SELECT following_id FROM user_follows WHERE follower_id = ?)'
+    ' ) match'
+    ' JOIN game g ON g.id = match.game_id'
+    ' WHERE g.id NOT IN (SELECT game_id FROM user_game_library WHERE user_id = ?)'
+)
+_SQL_INSERT_PREFERENCE = 'INSERT INTO user_preferences (user_id, tag, weight) VALUES (?, ?, ?)'
 
 
-@bp.route('/')
-@login_required
-def index():
-    """Show game recommendations based on user preferences."""
-    db = get_db()
-    
-    # Get user's preferred tags (handle case where table doesn't exist yet)
+def _build_recommendations(db, user_id):
+    """
+    Score candidate games for a user.
+    Returns (recommendations, has_preferences); recommendations holds plain
+    dicts so the result can be cached.
+    """
+    # Check for preferences (handle case where table doesn't exist yet)
     try:
-        user_tags = {row['tag']: row['weight'] for row in db.execute(
-            'SELECT tag, weight FROM user_preferences WHERE user_id = ?',
-            (g.user['id'],)
-        ).fetchall()}
+        has_preferences = db.execute(_SQL_HAS_PREFERENCES, (user_id,)).fetchone()[0] == 1
     except db.OperationalError:
-        # Table doesn't exist yet, initialize empty
-        user_tags = {}
-    
-    # Get user's current library game IDs
-    user_game_ids = {row['game_id'] for row in db.execute(
-        'SELECT game_id FROM user_game_library WHERE user_id = ?',
-        (g.user['id'],)
-    ).fetchall()}
-    
-    # Get games from followed users
-    followed_user_games = {}
-    if user_tags:
-        followed_users = db.execute(
-            'SELECT following_id FROM user_follows WHERE follower_id = ?',
-            (g.user['id'],)
-        ).fetchall()
-        
-        for followed in followed_users:
-            games = db.execute(
-                'SELECT g.id, g.name, g.appid, g.img_logo_url, ugl.playtime_forever'
-                ' FROM user_game_library ugl'
-                ' JOIN game g ON ugl.game_id = g.id'
-                ' WHERE ugl.user_id = ? AND g.id NOT IN ({})'.format(
-                    ','.join('?' * len(user_game_ids)) if user_game_ids else '0'
-                ),
-                (followed['following_id'],) + tuple(user_game_ids) if user_game_ids else (followed['following_id'],)
-            ).fetchall()
-            
-            for game in games:
-                if game['id'] not in followed_user_games:
-                    followed_user_games[game['id']] = {
-                        'game': game,
-                        'recommendation_score': 0,
-                        'reason': 'Played by followed users'
-                    }
+        has_preferences = False
     
-    # Get games with matching tags
-    tag_based_games = {}
-    if user_tags:
+    # Tag matches and followed-user games come back from a single query
+    rows = []
+    if has_preferences:
         try:
-            for tag, weight in user_tags.items():
-                games = db.execute(
-                    'SELECT g.id, g.name, g.appid, g.img_logo_url'
-                    ' FROM game g'
-                    ' JOIN game_tag gt ON g.id = gt.game_id'
-                    ' WHERE gt.tag = ? AND g.id NOT IN ({})'.format(
-                        ','.join('?' * len(user_game_ids)) if user_game_ids else '0'
-                    ),
-                    (tag,) + tuple(user_game_ids) if user_game_ids else (tag,)
-                ).fetchall()
-            
-                for game in games:
-                    if game['id'] not in tag_based_games:
-                        tag_based_games[game['id']] = {
-                            'game': game,
-                            'recommendation_score': 0,
-                            'matching_tags': []
-                        }
-                    tag_based_games[game['id']]['recommendation_score'] += weight
-                    tag_based_games[game['id']]['matching_tags'].append(tag)
+            rows = db.execute(_SQL_CANDIDATES, (user_id, user_id, user_id)).fetchall()
         except db.OperationalError:
             # game_tag table doesn't exist yet
             pass
     
-    # Combine recommendations
-    recommendations = {}
-    
-    # Add tag-based recommendations
-    for game_id, data in tag_based_games.items():
-        recommendations[game_id] = {
-            'game': data['game'],
-            'score': data['recommendation_score'],
-            'reason': f"Matches your tags: {', '.join(data['matching_tags'][:3])}"
-        }
-    
-    # Add followed user games (boost their score)
-    for game_id, data in followed_user_games.items():
-        if game_id in recommendations:
-            recommendations[game_id]['score'] += 5  # Boost for being played by friends
-            if 'friends' not in recommendations[game_id]['reason'].lower():
-                recommendations[game_id]['reason'] += '; Also played by followed users'
-        else:
-            recommendations[game_id] = {
-                'game': data['game'],
-                'score': 5,
-                'reason': data['reason']
+    # Group rows by game: tag matches add their weight, followed users add 5
+    candidates = {}
+    for row in rows:
+        candidate = candidates.get(row['id'])
+        if candidate is None:
+            candidate = candidates[row['id']] = {
+                'game': dict(row),
+                'score': 0,
+                'matching_tags': [],
+                'followed': False
             }
+        if row['tag'] is None:
+            candidate['followed'] = True
+            candidate['score'] += 5  # Boost for being played by friends
+        else:
+            candidate['score'] += row['weight']
+            candidate['matching_tags'].append(row['tag'])
+    
+    recommendations = []
+    for candidate in candidates.values():
+        if candidate['matching_tags']:
+            reason = f"Matches your tags: {', '.join(candidate['matching_tags'][:3])}"
+            if candidate['followed']:
+                reason += '; Also played by followed users'
+        else:
+            reason = 'Played by followed users'
+        recommendations.append({
+            'game': candidate['game'],
+            'score': candidate['score'],
+            'reason': reason
+        })
     
-    # Sort by recommendation score
-    sorted_recommendations = sorted(
-        recommendations.values(),
-        key=lambda x: x['score'],
-        reverse=True
-    )
+    # Top 50 by recommendation score, without sorting every candidate
+    top_recommendations = heapq.nlargest(50, recommendations, key=itemgetter('score'))
+    
+    return top_recommendations, has_preferences
+
+
+@bp.route('/')
+@login_required
+def index():
+    """Show game recommendations based on user preferences."""
+    key = recommendations_key(g.user['id'])
+    cached = cache.get(key)
+    if cached is None:
+        cached = _build_recommendations(get_db(), g.user['id'])
+        cache.set(key, cached, timeout=RECOMMENDATIONS_TIMEOUT)
+    recommendations, has_preferences = cached
     
     return render_template(
         'recommendations/index.html',
-        recommendations=sorted_recommendations[:50],  # Top 50
-        has_preferences=bool(user_tags)
+        recommendations=recommendations,
+        has_preferences=has_preferences
     )
 
 
@@ -146,15 +123,14 @@ def preferences():
             # Clear existing preferences
             db.execute('DELETE FROM user_preferences WHERE user_id = ?', (g.user['id'],))
             
-            # Add new preferences
-            for tag in selected_tags:
-                if tag in POPULAR_TAGS:
-                    db.execute(
-                        'INSERT INTO user_preferences (user_id, tag, weight) VALUES (?, ?, ?)',
-                        (g.user['id'], tag, 1.0)
-                    )
+            # Add new preferences, ignoring unknown or repeated tags
+            db.executemany(
+                _SQL_INSERT_PREFERENCE,
+                [(g.user['id'], tag, 1.0) for tag in dict.fromkeys(selected_tags) if tag in POPULAR_TAGS_SET]
+            )
             
             db.commit()
+            cache.delete(recommendations_key(g.user['id']))
             flash('Preferences updated successfully!')
             return redirect(url_for('recommendations.index'))
         except db.OperationalError:
@@ -197,7 +173,7 @@ def manage_game_tags(game_id):
             
             # Add new tags
             for tag in selected_tags:
-                if tag in POPULAR_TAGS:
+                if tag in POPULAR_TAGS_SET:
                     try:
                         db.execute(
                             'INSERT INTO game_tag (game_id, tag) VALUES (?, ?)',
@@ -207,6 +183,7 @@ def manage_game_tags(game_id):
                         pass  # Tag already exists
             
             db.commit()
+            cache.delete(recommendations_key(g.user['id']))
             flash(f'Tags updated for {game["name"]}!')
             return redirect(url_for('steam.library'))
         except db.OperationalError:
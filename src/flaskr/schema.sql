@@ -1,3 +1,5 @@
+PRAGMA foreign_keys = OFF;
+
 DROP TABLE IF EXISTS user;
 DROP TABLE IF EXISTS post;
 DROP TABLE IF EXISTS user_game_library;
@@ -5,6 +7,8 @@ DROP TABLE IF EXISTS user_follows;
 DROP TABLE IF EXISTS game_tag;
 DROP TABLE IF EXISTS user_preferences;
 DROP TABLE IF EXISTS game;
+DROP TABLE IF EXISTS epic_catalog_cache;
+DROP TABLE IF EXISTS steam_tag_cache;
 
 CREATE TABLE user (
                       id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -70,3 +74,7 @@ CREATE TABLE user_preferences (
                       FOREIGN KEY (user_id) REFERENCES user (id),
                       UNIQUE(user_id, tag)
 );
+
+-- Indexes and API response caches are created by schema_upgrade.sql
+
+PRAGMA foreign_keys = ON;
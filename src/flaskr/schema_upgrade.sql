@@ -0,0 +1,24 @@
+-- Indexes and API response caches. Unlike schema.sql this is safe to run on
+-- an existing database, and runs whenever the app first connects, so
+-- databases created before one was added pick it up without an init-db.
+
+-- UNIQUE constraints in schema.sql already index (user_id, game_id),
+-- (follower_id, following_id), (game_id, tag) and game.appid.
+CREATE INDEX IF NOT EXISTS idx_ugl_user_game_playtime ON user_game_library (user_id, game_id, playtime_forever);
+CREATE INDEX IF NOT EXISTS idx_game_tag_tag ON game_tag (tag, game_id);
+
+CREATE TABLE IF NOT EXISTS epic_catalog_cache (
+                      offer_id TEXT PRIMARY KEY,
+                      json TEXT,
+                      fetched_at INTEGER NOT NULL
+);
+
+-- tags is the JSON list mapped from Store appdetails, or NULL if the lookup failed
+CREATE TABLE IF NOT EXISTS steam_tag_cache (
+                      appid TEXT PRIMARY KEY,
+                      tags TEXT,
+                      fetched_at INTEGER NOT NULL
+);
+
+-- Replaced by steam_tag_cache, which does not keep the full payloads
+DROP TABLE IF EXISTS steam_appdetails_cache;
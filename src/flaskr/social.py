@@ -3,10 +3,52 @@ from flask import (
 )
 
 from flaskr.auth import login_required
+from flaskr.cache import cache, recommendations_key
 from flaskr.db import get_db
 
 bp = Blueprint('social', __name__, url_prefix='/social')
 
+# Common games shown per page
+PER_PAGE = 50
+
+# Common games sort whitelist: query-string value -> SQL
+_COMMON_GAME_SORTS = {
+    'name': 'g.name COLLATE NOCASE',
+    'playtime': 'total_playtime',
+    'my_playtime': 'my_playtime',
+    'their_playtime': 'their_playtime',
+    'relevance': 'relevance'
+}
+_SORT_ORDERS = {'asc': 'ASC', 'desc': 'DESC'}
+
+# Common games page query for every sort, built once; g.id keeps pages stable on ties
+_COMMON_GAMES_QUERIES = {
+    (sort_by, sort_order): (
+        'SELECT g.id, g.appid, g.name, g.img_logo_url,'
+        ' my_lib.playtime_forever as my_playtime,'
+        ' their_lib.playtime_forever as their_playtime,'
+        ' (my_lib.playtime_forever + their_lib.playtime_forever) as total_playtime,'
+        ' relevance(my_lib.playtime_forever, their_lib.playtime_forever) as relevance'
+        ' FROM game g'
+        ' INNER JOIN user_game_library my_lib ON g.id = my_lib.game_id AND my_lib.user_id = ?'
+        ' INNER JOIN user_game_library their_lib ON g.id = their_lib.game_id AND their_lib.user_id = ?'
+        f' ORDER BY {column} {direction}, g.id'
+        ' LIMIT ? OFFSET ?'
+    )
+    for sort_by, column in _COMMON_GAME_SORTS.items()
+    for sort_order, direction in _SORT_ORDERS.items()
+}
+
+_SQL_FOLLOW = 'INSERT OR IGNORE INTO user_follows (follower_id, following_id) VALUES (?, ?)'
+_SQL_IS_FOLLOWING = (
+    'SELECT EXISTS (SELECT 1 FROM user_follows WHERE follower_id = ? AND following_id = ?)'
+)
+_SQL_COUNT_COMMON_GAMES = (
+    'SELECT COUNT(*) FROM user_game_library my_lib'
+    ' INNER JOIN user_game_library their_lib ON my_lib.game_id = their_lib.game_id AND their_lib.user_id = ?'
+    ' WHERE my_lib.user_id = ?'
+)
+
 
 @bp.route('/users')
 @login_required
@@ -53,21 +95,15 @@ def follow_user(user_id):
         flash('You cannot follow yourself.')
         return redirect(url_for('social.users'))
     
-    # Check if already following
-    existing = db.execute(
-        'SELECT id FROM user_follows WHERE follower_id = ? AND following_id = ?',
-        (g.user['id'], user_id)
-    ).fetchone()
+    # The UNIQUE constraint makes a repeat follow a no-op
+    cursor = db.execute(_SQL_FOLLOW, (g.user['id'], user_id))
+    db.commit()
     
-    if existing:
-        flash(f'You are already following {user["username"]}.')
-    else:
-        db.execute(
-            'INSERT INTO user_follows (follower_id, following_id) VALUES (?, ?)',
-            (g.user['id'], user_id)
-        )
-        db.commit()
+    if cursor.rowcount:
+        cache.delete(recommendations_key(g.user['id']))
         flash(f'You are now following {user["username"]}!')
+    else:
+        flash(f'You are already following {user["username"]}.')
     
     return redirect(url_for('social.users'))
 
@@ -85,6 +121,7 @@ def unfollow_user(user_id):
             (g.user['id'], user_id)
         )
         db.commit()
+        cache.delete(recommendations_key(g.user['id']))
         flash(f'You have unfollowed {user["username"]}.')
     
     return redirect(request.referrer or url_for('social.users'))
@@ -121,84 +158,34 @@ def common_games(user_id):
         return redirect(url_for('social.users'))
     
     # Check if following
-    is_following = db.execute(
-        'SELECT id FROM user_follows WHERE follower_id = ? AND following_id = ?',
-        (g.user['id'], user_id)
-    ).fetchone() is not None
+    is_following = db.execute(_SQL_IS_FOLLOWING, (g.user['id'], user_id)).fetchone()[0] == 1
     
     # Get sort parameters (default to relevance)
     sort_by = request.args.get('sort', 'relevance')
     sort_order = request.args.get('order', 'desc')
     
-    valid_sorts = {
-        'name': 'name',
-        'playtime': 'playtime',
-        'my_playtime': 'my_playtime',
-        'their_playtime': 'their_playtime',
-        'relevance': 'relevance'
-    }
-    valid_orders = ['asc', 'desc']
-    
-    if sort_by not in valid_sorts:
+    if sort_by not in _COMMON_GAME_SORTS:
         sort_by = 'name'
-    if sort_order not in valid_orders:
+    if sort_order not in _SORT_ORDERS:
         sort_order = 'asc'
     
-    order_column = valid_sorts[sort_by]
-    order_direction = sort_order.upper()
+    total = db.execute(_SQL_COUNT_COMMON_GAMES, (user_id, g.user['id'])).fetchone()[0]
+    page_count = max(1, -(-total // PER_PAGE))
+    page = min(max(request.args.get('page', 1, type=int), 1), page_count)
     
-    # Get common games with playtime
-    # Calculate relevance score: geometric mean of playtimes * log of total playtime
-    # This favors games where both users have significant playtime
-    common_games_raw = db.execute(
-        'SELECT g.id, g.appid, g.name, g.img_logo_url,'
-        ' my_lib.playtime_forever as my_playtime,'
-        ' their_lib.playtime_forever as their_playtime,'
-        ' (my_lib.playtime_forever + their_lib.playtime_forever) as total_playtime'
-        ' FROM game g'
-        ' INNER JOIN user_game_library my_lib ON g.id = my_lib.game_id AND my_lib.user_id = ?'
-        ' INNER JOIN user_game_library their_lib ON g.id = their_lib.game_id AND their_lib.user_id = ?',
-        (g.user['id'], user_id)
+    # Get common games with playtime, scored and sorted by SQLite
+    common_games = db.execute(
+        _COMMON_GAMES_QUERIES[(sort_by, sort_order)],
+        (g.user['id'], user_id, PER_PAGE, (page - 1) * PER_PAGE)
     ).fetchall()
     
-    # Calculate relevance score for each game
-    import math
-    common_games = []
-    for game in common_games_raw:
-        my_playtime = game['my_playtime'] or 0
-        their_playtime = game['their_playtime'] or 0
-        total_playtime = game['total_playtime'] or 0
-        
-        # Relevance = geometric mean (balanced playtime) * log(total + 1)
-        # This favors games where both users have significant playtime
-        # while still rewarding higher total playtime
-        if my_playtime > 0 and their_playtime > 0:
-            geometric_mean = math.sqrt(my_playtime * their_playtime)
-            relevance = geometric_mean * math.log(total_playtime + 1)
-        else:
-            relevance = 0
-        
-        # Create a dict with all fields plus relevance
-        game_dict = dict(game)
-        game_dict['relevance'] = relevance
-        common_games.append(game_dict)
-    
-    # Sort by the selected column
-    if sort_by == 'relevance':
-        common_games.sort(key=lambda x: x['relevance'], reverse=(sort_order == 'desc'))
-    elif sort_by == 'name':
-        common_games.sort(key=lambda x: x['name'].lower(), reverse=(sort_order == 'desc'))
-    elif sort_by == 'playtime':
-        common_games.sort(key=lambda x: x['total_playtime'], reverse=(sort_order == 'desc'))
-    elif sort_by == 'my_playtime':
-        common_games.sort(key=lambda x: x['my_playtime'], reverse=(sort_order == 'desc'))
-    elif sort_by == 'their_playtime':
-        common_games.sort(key=lambda x: x['their_playtime'], reverse=(sort_order == 'desc'))
-    
     return render_template(
         'social/common_games.html',
         other_user=other_user,
         common_games=common_games,
+        total=total,
+        page=page,
+        page_count=page_count,
         is_following=is_following,
         sort_by=sort_by,
         sort_order=sort_order
@@ -1,16 +1,196 @@
+import json
+import queue
 import random
+import re
 import requests
+import sqlite3
 import time
 import threading
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
 from flask import (
     Blueprint, flash, g, redirect, render_template, request, url_for, current_app
 )
 
 from flaskr.auth import login_required
+from flaskr.cache import cache, load_cached_rows, recommendations_key
 from flaskr.db import get_db
+from flaskr.db_pool import connect
+from flaskr.tags import POPULAR_TAGS_SET
+
+try:
+    # orjson parses large GetOwnedGames payloads several times faster than json
+    from orjson import loads as _json_loads
+except ImportError:
+    _json_loads = json.loads
 
 bp = Blueprint('steam', __name__, url_prefix='/steam')
 
+# Profile or vanity segment of a steamcommunity.com URL, without query or fragment
+_STEAM_URL_RE = re.compile(r'steamcommunity\.com/(?:profiles|id)/([^/?#]+)', re.IGNORECASE)
+
+# Games per lookup or multi-row upsert statement in import_library (5 parameters each)
+_UPSERT_CHUNK = 500
+
+# Games shown per library page
+PER_PAGE = 50
+
+# Library sort whitelist: query-string value -> SQL
+_LIBRARY_SORTS = {
+    'name': 'g.name',
+    'playtime': 'ugl.playtime_forever',
+    'imported': 'ugl.imported_at'
+}
+_SORT_ORDERS = {'asc': 'ASC', 'desc': 'DESC'}
+
+# Library page and highlighted-game position queries for every sort,
+# built once; g.id keeps pages stable on ties
+_LIBRARY_QUERIES = {
+    (sort_by, sort_order): (
+        'SELECT g.id, g.appid, g.name, g.platform, g.playtime_forever, g.img_icon_url, g.img_logo_url,'
+        ' ugl.imported_at, ugl.playtime_forever as user_playtime'
+        ' FROM user_game_library ugl'
+        ' JOIN game g ON ugl.game_id = g.id'
+        ' WHERE ugl.user_id = ?'
+        f' ORDER BY {column} {direction}, g.id'
+        ' LIMIT ? OFFSET ?'
+    )
+    for sort_by, column in _LIBRARY_SORTS.items()
+    for sort_order, direction in _SORT_ORDERS.items()
+}
+_LIBRARY_POSITION_QUERIES = {
+    (sort_by, sort_order): (
+        'SELECT position FROM ('
+        f' SELECT g.id, ROW_NUMBER() OVER (ORDER BY {column} {direction}, g.id) as position'
+        ' FROM user_game_library ugl'
+        ' JOIN game g ON ugl.game_id = g.id'
+        ' WHERE ugl.user_id = ?'
+        ') WHERE id = ?'
+    )
+    for sort_by, column in _LIBRARY_SORTS.items()
+    for sort_order, direction in _SORT_ORDERS.items()
+}
+
+# Steam genre and category names mapped onto our tags (see POPULAR_TAGS);
+# lookups go through the lowercased copy so matching is case-insensitive
+_TAG_MAPPING = {
+    'Action': 'Action',
+    'Adventure': 'Adventure',
+    'RPG': 'RPG',
+    'Role-playing': 'RPG',
+    'Strategy': 'Strategy',
+    'Simulation': 'Simulation',
+    'Sports': 'Sports',
+    'Racing': 'Racing',
+    'Puzzle': 'Puzzle',
+    'Indie': 'Indie',
+    'Casual': 'Casual',
+    'First-Person Shooter': 'FPS',
+    'FPS': 'FPS',
+    'Horror': 'Horror',
+    'Sci-Fi': 'Sci-Fi',
+    'Science Fiction': 'Sci-Fi',
+    'Fantasy': 'Fantasy',
+    'Open World': 'Open World',
+    'Story Rich': 'Story Rich',
+    'Co-op': 'Co-op',
+    'Cooperative': 'Co-op',
+    'Competitive': 'Competitive',
+    'Sandbox': 'Sandbox',
+    'Survival': 'Survival',
+    'Crafting': 'Crafting',
+    'Building': 'Building',
+    'Single-player': 'Singleplayer',
+    'Singleplayer': 'Singleplayer',
+    'Multi-player': 'Multiplayer',
+    'Multiplayer': 'Multiplayer'
+}
+_TAG_MAPPING_LOWER = {key.lower(): value for key, value in _TAG_MAPPING.items()}
+
+_SQL_UPSERT_LIBRARY = (
+    'INSERT INTO user_game_library (user_id, game_id, playtime_forever) VALUES (?, ?, ?)'
+    ' ON CONFLICT (user_id, game_id) DO UPDATE SET playtime_forever = excluded.playtime_forever,'
+    ' imported_at = CURRENT_TIMESTAMP'
+)
+_SQL_CACHE_TAGS = (
+    'INSERT OR REPLACE INTO steam_tag_cache (appid, tags, fetched_at) VALUES (?, ?, ?)'
+)
+_SQL_TAGGED_LIBRARY_GAMES = (
+    'SELECT DISTINCT gt.game_id FROM game_tag gt'
+    ' JOIN user_game_library ugl ON ugl.game_id = gt.game_id'
+    ' WHERE ugl.user_id = ?'
+)
+_SQL_COUNT_LIBRARY = 'SELECT COUNT(*) FROM user_game_library WHERE user_id = ?'
+# The random pick runs over the library index alone; only the winner is joined
+_SQL_RANDOM_GAME = (
+    'SELECT g.id, g.appid, g.name FROM game g'
+    ' WHERE g.id = (SELECT game_id FROM user_game_library WHERE user_id = ? ORDER BY RANDOM() LIMIT 1)'
+)
+
+# Number of appdetails lookups run at once by get_game_details_bulk
+_DETAILS_WORKERS = 8
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: up to capacity calls at once, then refill_rate
+    calls per second. acquire() blocks until a call is allowed.
+    """
+
+    def __init__(self, capacity, refill_rate):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.refill_rate
+            time.sleep(wait)
+
+
+# Steam Store allows roughly 200 appdetails requests per 5 minutes
+_STORE_LIMITER = RateLimiter(capacity=200, refill_rate=200 / 300)
+
+# Lookups written per commit by the background tagger, and the most queued
+# games it takes on in one pass
+_TAG_COMMIT_EVERY = 25
+_TAG_BATCH = 200
+_TAGGER_LOCK = threading.Lock()
+
+# Store appdetails rarely change; failed lookups are retried much sooner
+_APPDETAILS_CACHE_TTL = 30 * 24 * 60 * 60
+_APPDETAILS_MISS_TTL = 60 * 60
+
+# Backoff after a 429: retries, and the base and cap for jittered waits in seconds
+_STORE_RETRIES = 3
+_BACKOFF_BASE = 2
+_BACKOFF_CAP = 60
+
+# Shared session so Steam API calls reuse pooled keep-alive connections.
+# 429 is left out of the retry list: get_game_details backs off on it itself.
+_SESSION = requests.Session()
+_retry_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504]),
+)
+_SESSION.mount('http://', _retry_adapter)
+_SESSION.mount('https://', _retry_adapter)
+# Ask for every content encoding urllib3 can decode here (br when brotli is installed)
+_SESSION.headers.update(make_headers(accept_encoding=True))
+
 
 def get_steam_api_key():
     """Get Steam API key from config or environment variable."""
@@ -19,6 +199,38 @@ def get_steam_api_key():
     return current_app.config.get('STEAM_API_KEY') or os.environ.get('STEAM_API_KEY')
 
 
+@cache.memoize(timeout=86400)
+def _resolve_vanity_url(api_key, vanity_url):
+    """
+    Look up a vanity URL, caching the ResolveVanityURL response.
+    Callers pass the name lowercased; Steam matches vanity URLs case-insensitively.
+    """
+    url = "http://api.steampowered.com/ISteamUser/ResolveVanityURL/v0001/"
+    params = {
+        'key': api_key,
+        'vanityurl': vanity_url
+    }
+    response = _SESSION.get(url, params=params, timeout=10)
+    response.raise_for_status()
+    return _json_loads(response.content).get('response', {})
+
+
+@cache.memoize(timeout=300)
+def _get_owned_games(api_key, steam_id):
+    """Fetch the GetOwnedGames payload, cached briefly for repeated imports."""
+    url = "http://api.steampowered.com/IPlayerService/GetOwnedGames/v0001/"
+    params = {
+        'key': api_key,
+        'steamid': steam_id,
+        'format': 'json',
+        'include_appinfo': True,
+        'include_played_free_games': True
+    }
+    response = _SESSION.get(url, params=params, timeout=10)
+    response.raise_for_status()
+    return _json_loads(response.content)
+
+
 def resolve_steam_id(steam_id_input):
     """
     Resolve Steam ID from various formats (vanity URL, Steam ID64, etc.)
@@ -28,17 +240,15 @@ def resolve_steam_id(steam_id_input):
     if not api_key:
         return None, 'Steam API key is not configured. Please set STEAM_API_KEY environment variable or add it to config.py'
     
-    # Clean the input - remove common Steam profile URL patterns
+    # Clean the input - strip https://steamcommunity.com/profiles/ or /id/ URLs
     steam_id_input = steam_id_input.strip()
-    # Remove https://steamcommunity.com/profiles/ prefix
-    if 'steamcommunity.com/profiles/' in steam_id_input:
-        steam_id_input = steam_id_input.split('steamcommunity.com/profiles/')[-1].split('/')[0]
-    # Remove https://steamcommunity.com/id/ prefix
-    elif 'steamcommunity.com/id/' in steam_id_input:
-        steam_id_input = steam_id_input.split('steamcommunity.com/id/')[-1].split('/')[0]
+    match = _STEAM_URL_RE.search(steam_id_input)
+    if match:
+        steam_id_input = match.group(1)
     
-    # If it's already numeric, validate it's a valid Steam ID64 (should be 17 digits)
-    if steam_id_input.isdigit():
+    # If it's already numeric, validate it's a valid Steam ID64 (should be 17 digits).
+    # isascii() keeps out non-ASCII digits such as '١' that isdigit() accepts.
+    if steam_id_input.isascii() and steam_id_input.isdigit():
         if len(steam_id_input) == 17:
             return steam_id_input, None
         else:
@@ -46,23 +256,19 @@ def resolve_steam_id(steam_id_input):
     
     # Try to resolve as vanity URL
     try:
-        url = "http://api.steampowered.com/ISteamUser/ResolveVanityURL/v0001/"
-        params = {
-            'key': api_key,
-            'vanityurl': steam_id_input
-        }
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        response_data = data.get('response', {})
+        vanity_url = steam_id_input.lower()
+        response_data = _resolve_vanity_url(api_key, vanity_url)
         if response_data.get('success') == 1:
             return response_data.get('steamid'), None
-        elif response_data.get('success') == 42:
+        # Only successful lookups stay cached; the user may be fixing a typo
+        cache.delete_memoized(_resolve_vanity_url, api_key, vanity_url)
+        if response_data.get('success') == 42:
             return None, f'Vanity URL "{steam_id_input}" not found. Please check your Steam profile username.'
         else:
             return None, f'Failed to resolve vanity URL. Steam API returned: {response_data}'
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
+        # ValueError covers unparsable bodies, which response.json() used to
+        # raise as a RequestException
         return None, f'Error connecting to Steam API: {str(e)}'
     except Exception as e:
         return None, f'Unexpected error resolving Steam ID: {str(e)}'
@@ -78,17 +284,7 @@ def fetch_steam_library(steam_id):
         return None, 'Steam API key is not configured.'
     
     try:
-        url = "http://api.steampowered.com/IPlayerService/GetOwnedGames/v0001/"
-        params = {
-            'key': api_key,
-            'steamid': steam_id,
-            'format': 'json',
-            'include_appinfo': True,
-            'include_played_free_games': True
-        }
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
+        data = _get_owned_games(api_key, steam_id)
         
         if 'response' in data:
             if 'games' in data['response']:
@@ -104,13 +300,27 @@ def fetch_steam_library(steam_id):
         if e.response.status_code == 403:
             return None, 'Access denied. Your Steam profile may be private. Please set your profile to public in Steam settings.'
         return None, f'HTTP error fetching Steam library: {e.response.status_code} - {e.response.text[:200]}'
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         return None, f'Error connecting to Steam API: {str(e)}'
     except Exception as e:
         return None, f'Unexpected error: {str(e)}'
 
 
-def get_game_details(appid, retry_count=0):
+def _retry_after_seconds(response):
+    """Seconds requested by a Retry-After header, or None if absent or unparsable."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        return max(0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+@cache.memoize(timeout=86400)
+def get_game_details(appid):
     """
     Get game details from Steam Store API.
     Returns game info dict or None.
@@ -121,181 +331,224 @@ def get_game_details(appid, retry_count=0):
             'appids': appid,
             'l': 'en'
         }
-        response = requests.get(url, params=params, timeout=10)
-        
-        # Handle rate limiting
-        if response.status_code == 429:
-            if retry_count < 3:
-                # Wait longer with each retry (exponential backoff)
-                wait_time = (2 ** retry_count) * 2  # 2s, 4s, 8s
-                time.sleep(wait_time)
-                return get_game_details(appid, retry_count + 1)
-            else:
-                print(f"Rate limited for game {appid} after {retry_count} retries")
+        wait_time = _BACKOFF_BASE
+        for attempt in range(_STORE_RETRIES + 1):
+            _STORE_LIMITER.acquire()
+            response = _SESSION.get(url, params=params, timeout=10)
+            if response.status_code != 429:
+                break
+            if attempt == _STORE_RETRIES:
+                print(f"Rate limited for game {appid} after {attempt} retries")
                 return None
+            # Honour Retry-After, else use decorrelated jitter so concurrent
+            # workers don't retry in lockstep
+            wait_time = _retry_after_seconds(response) or min(
+                _BACKOFF_CAP, random.uniform(_BACKOFF_BASE, wait_time * 3)
+            )
+            time.sleep(wait_time)
         
         response.raise_for_status()
-        data = response.json()
+        data = _json_loads(response.content)
         
         if str(appid) in data and data[str(appid)]['success']:
             return data[str(appid)]['data']
         return None
-    except requests.RequestException as e:
+    except (requests.RequestException, ValueError) as e:
         if "429" not in str(e):  # Don't print rate limit errors, we handle them above
             print(f"Error fetching game details: {e}")
         return None
 
 
-def fetch_tags_background(app, games_to_tag):
+def get_game_details_bulk(appids):
+    """
+    Fetch game details for many appids concurrently.
+    Yields (appid, game info dict or None) as each lookup finishes.
+    """
+    app = current_app._get_current_object()
+
+    def fetch(appid):
+        # worker threads need their own app context for the details cache
+        with app.app_context():
+            return get_game_details(appid)
+
+    with ThreadPoolExecutor(max_workers=_DETAILS_WORKERS) as executor:
+        futures = {executor.submit(fetch, appid): appid for appid in appids}
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result()
+            except Exception as e:
+                print(f"Error fetching game details for {futures[future]}: {e}")
+
+
+def _load_cached_tags(db, appids):
     """
-    Background function to fetch tags for games.
-    Runs in a separate thread to avoid blocking the import.
+    Look up tags saved from any user's earlier import.
+    Returns dict mapping appid to tag list for fresh cache entries; recent
+    failed lookups map to an empty list so they are not retried yet.
     """
+    cached = load_cached_rows(
+        db, 'steam_tag_cache', 'appid', 'tags', appids, _APPDETAILS_CACHE_TTL, _APPDETAILS_MISS_TTL
+    )
+    return {appid: _json_loads(tags) if tags is not None else [] for appid, tags in cached.items()}
+
+
+def enqueue_tag_fetch(games_to_tag):
+    """
+    Queue games for background tagging.
+    Each app has one tagger thread fed by a queue, so concurrent imports
+    share a single connection and the Store rate limit.
+    """
+    app = current_app._get_current_object()
+    with _TAGGER_LOCK:
+        tagger = app.extensions.get('steam_tagger')
+        if tagger is None or not tagger['thread'].is_alive():
+            tag_queue = tagger['queue'] if tagger is not None else queue.Queue()
+            thread = threading.Thread(
+                target=_tag_worker,
+                args=(app, tag_queue),
+                name='steam-tagger',
+                daemon=True
+            )
+            tagger = app.extensions['steam_tagger'] = {'queue': tag_queue, 'thread': thread}
+            thread.start()
+    for game_info in games_to_tag:
+        tagger['queue'].put(game_info)
+
+
+def _tag_worker(app, tag_queue):
+    """Tag queued games for the lifetime of the process."""
     with app.app_context():
-        import sqlite3
-        from flask import current_app
-        
-        # Create a new database connection for this thread
-        db_path = current_app.config['DATABASE']
-        conn = sqlite3.connect(db_path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        db = conn
+        # A dedicated long-lived connection configured like pooled ones, but
+        # waiting longer for the write lock since nobody is waiting on this thread
+        conn = connect(current_app.config['DATABASE'])
+        conn.execute('PRAGMA busy_timeout = 30000')
         
-        tagged_count = 0
-        
-        try:
-            for game_info in games_to_tag:
+        while True:
+            # Block for work, then take whatever else is already waiting
+            batch = {}
+            game_info = tag_queue.get()
+            while True:
+                batch[game_info['game_id']] = game_info
+                if len(batch) >= _TAG_BATCH:
+                    break
                 try:
-                    # Add delay between requests to avoid rate limiting
-                    # Steam allows ~200 requests per 5 minutes, so ~1 request per 1.5 seconds is safe
-                    time.sleep(1.5)
-                    
-                    appid = game_info['appid']
-                    game_id = game_info['game_id']
-                    
-                    steam_tags = get_game_tags_from_steam(appid)
-                    if steam_tags:
-                        # Remove existing tags for this game
-                        db.execute('DELETE FROM game_tag WHERE game_id = ?', (game_id,))
-                        
-                        # Add new tags
-                        for tag in steam_tags:
-                            try:
-                                db.execute(
-                                    'INSERT INTO game_tag (game_id, tag) VALUES (?, ?)',
-                                    (game_id, tag)
-                                )
-                            except sqlite3.IntegrityError:
-                                pass  # Tag already exists
-                        tagged_count += 1
-                        db.commit()
-                except Exception as e:
-                    # If we hit rate limits, wait longer and continue
-                    if "429" in str(e) or "Too Many Requests" in str(e):
-                        print(f"Rate limited for game {appid}, waiting longer...")
-                        time.sleep(10)  # Wait 10 seconds before continuing
-                    else:
-                        print(f"Error fetching tags for game {appid}: {e}")
+                    game_info = tag_queue.get_nowait()
+                except queue.Empty:
+                    break
+            try:
+                tag_games(conn, list(batch.values()))
+            except Exception as e:
+                print(f"Error in background tag fetching: {e}")
+
+
+def tag_games(db, games_to_tag):
+    """
+    Fetch and save tags for games on the tagger connection.
+    Games whose tags are cached are tagged straight away; the rest are
+    looked up by get_game_details_bulk, paced by the Store rate limiter. Results
+    are written from the calling thread so the connection stays single-threaded.
+    """
+    tagged_count = 0
+    
+    # Results are buffered and written in short batches, so no write
+    # transaction stays open while waiting on the Store API
+    pending_tags = []
+    pending_cache = []
+    
+    def flush():
+        try:
+            if pending_tags:
+                # Replace each game's tags
+                db.executemany(
+                    'DELETE FROM game_tag WHERE game_id = ?',
+                    [(game_id,) for game_id, _ in pending_tags]
+                )
+                db.executemany(
+                    'INSERT OR IGNORE INTO game_tag (game_id, tag) VALUES (?, ?)',
+                    [(game_id, tag) for game_id, steam_tags in pending_tags for tag in steam_tags]
+                )
+            if pending_cache:
+                db.executemany(_SQL_CACHE_TAGS, pending_cache)
+            db.commit()
+        except sqlite3.Error as e:
+            # Drop the batch rather than retrying it forever
+            db.rollback()
+            print(f"Error saving game tags: {e}")
         finally:
-            conn.close()
-        
-        print(f"Background tag fetching completed. Tagged {tagged_count} games.")
+            pending_tags.clear()
+            pending_cache.clear()
+    
+    cached_tags = _load_cached_tags(db, [game_info['appid'] for game_info in games_to_tag])
+    to_fetch = []
+    for game_info in games_to_tag:
+        steam_tags = cached_tags.get(game_info['appid'])
+        if steam_tags is None:
+            to_fetch.append(game_info)
+        elif steam_tags:
+            pending_tags.append((game_info['game_id'], steam_tags))
+            tagged_count += 1
+    flush()
+    
+    game_ids = {game_info['appid']: game_info['game_id'] for game_info in to_fetch}
+    for appid, game_details in get_game_details_bulk(list(game_ids)):
+        steam_tags = tags_from_game_details(game_details)
+        # Only the mapped tags are kept; a failed lookup is saved as NULL
+        pending_cache.append(
+            (appid, json.dumps(steam_tags) if game_details is not None else None, int(time.time()))
+        )
+        if steam_tags:
+            pending_tags.append((game_ids[appid], steam_tags))
+            tagged_count += 1
+        if len(pending_cache) >= _TAG_COMMIT_EVERY:
+            flush()
+    flush()
+    
+    print(f"Background tag fetching completed. Tagged {tagged_count} games.")
 
 
-def get_game_tags_from_steam(appid):
+def tags_from_game_details(game_details):
     """
-    Get game tags from Steam Store API.
+    Map a Steam Store appdetails payload onto our tag names.
     Returns list of tag strings or empty list.
     """
-    try:
-        game_details = get_game_details(appid)
-        if not game_details:
-            return []
-        
-        tags = []
-        
-        # Steam API returns genres
-        if 'genres' in game_details:
-            for genre in game_details['genres']:
-                if 'description' in genre:
-                    tags.append(genre['description'])
-        
-        # Get categories (these include tags like "Single-player", "Multi-player", etc.)
-        if 'categories' in game_details:
-            for category in game_details['categories']:
-                if 'description' in category:
-                    cat_desc = category['description']
-                    # Map Steam categories to our tag system
-                    if 'Single-player' in cat_desc:
-                        tags.append('Singleplayer')
-                    elif 'Multi-player' in cat_desc:
-                        tags.append('Multiplayer')
-                    elif 'Co-op' in cat_desc:
-                        tags.append('Co-op')
-                    elif 'Competitive' in cat_desc:
-                        tags.append('Competitive')
-        
-        # Normalize tags to match our POPULAR_TAGS list
-        # These should match the tags in recommendations.py
-        POPULAR_TAGS = [
-            'Action', 'Adventure', 'RPG', 'Strategy', 'Simulation', 'Sports',
-            'Racing', 'Puzzle', 'Indie', 'Casual', 'Multiplayer', 'Singleplayer',
-            'FPS', 'Horror', 'Sci-Fi', 'Fantasy', 'Open World', 'Story Rich',
-            'Co-op', 'Competitive', 'Sandbox', 'Survival', 'Crafting', 'Building'
-        ]
-        normalized_tags = []
-        tag_mapping = {
-            'Action': 'Action',
-            'Adventure': 'Adventure',
-            'RPG': 'RPG',
-            'Role-playing': 'RPG',
-            'Strategy': 'Strategy',
-            'Simulation': 'Simulation',
-            'Sports': 'Sports',
-            'Racing': 'Racing',
-            'Puzzle': 'Puzzle',
-            'Indie': 'Indie',
-            'Casual': 'Casual',
-            'First-Person Shooter': 'FPS',
-            'FPS': 'FPS',
-            'Horror': 'Horror',
-            'Sci-Fi': 'Sci-Fi',
-            'Science Fiction': 'Sci-Fi',
-            'Fantasy': 'Fantasy',
-            'Open World': 'Open World',
-            'Story Rich': 'Story Rich',
-            'Co-op': 'Co-op',
-            'Cooperative': 'Co-op',
-            'Competitive': 'Competitive',
-            'Sandbox': 'Sandbox',
-            'Survival': 'Survival',
-            'Crafting': 'Crafting',
-            'Building': 'Building',
-            'Single-player': 'Singleplayer',
-            'Singleplayer': 'Singleplayer',
-            'Multi-player': 'Multiplayer',
-            'Multiplayer': 'Multiplayer'
-        }
-        
-        for tag in tags:
-            # Try exact match first
-            if tag in tag_mapping:
-                normalized = tag_mapping[tag]
-                if normalized in POPULAR_TAGS and normalized not in normalized_tags:
-                    normalized_tags.append(normalized)
-            # Try case-insensitive match
-            else:
-                tag_lower = tag.lower()
-                for key, value in tag_mapping.items():
-                    if key.lower() == tag_lower:
-                        if value in POPULAR_TAGS and value not in normalized_tags:
-                            normalized_tags.append(value)
-                        break
-        
-        return normalized_tags
-    except Exception as e:
-        print(f"Error fetching game tags for appid {appid}: {e}")
+    if not game_details:
+        return []
+    
+    # Delisted and stub apps often come back with neither list
+    genres = game_details.get('genres') or []
+    categories = game_details.get('categories') or []
+    if not genres and not categories:
         return []
+    
+    tags = []
+    
+    # Steam API returns genres
+    for genre in genres:
+        if 'description' in genre:
+            tags.append(genre['description'])
+    
+    # Get categories (these include tags like "Single-player", "Multi-player", etc.)
+    for category in categories:
+        if 'description' in category:
+            cat_desc = category['description']
+            # Map Steam categories to our tag system
+            if 'Single-player' in cat_desc:
+                tags.append('Singleplayer')
+            elif 'Multi-player' in cat_desc:
+                tags.append('Multiplayer')
+            elif 'Co-op' in cat_desc:
+                tags.append('Co-op')
+            elif 'Competitive' in cat_desc:
+                tags.append('Competitive')
+    
+    # Normalize tags to match the POPULAR_TAGS list in tags.py
+    normalized_tags = {}
+    for tag in tags:
+        normalized = _TAG_MAPPING_LOWER.get(tag.lower())
+        if normalized in POPULAR_TAGS_SET:
+            normalized_tags[normalized] = None
+    
+    return list(normalized_tags)
 
 
 @bp.route('/import', methods=('GET', 'POST'))
@@ -329,74 +582,69 @@ def import_library():
         
         if error is None:
             db = get_db()
-            imported_count = 0
-            updated_count = 0
             tag_fetch_enabled = request.form.get('fetch_tags', 'true') == 'true'
-            games_to_tag = []  # Store games that need tags fetched
             
-            for game_data in games:
-                appid = game_data.get('appid')
-                name = game_data.get('name', 'Unknown Game')
-                playtime = game_data.get('playtime_forever', 0)
-                img_icon_url = game_data.get('img_icon_url', '')
-                img_logo_url = game_data.get('img_logo_url', '')
-                
-                # Insert or update game
-                try:
-                    db.execute(
-                        'INSERT INTO game (appid, name, platform, playtime_forever, img_icon_url, img_logo_url)'
-                        ' VALUES (?, ?, ?, ?, ?, ?)',
-                        (str(appid), name, 'steam', playtime, img_icon_url, img_logo_url)
-                    )
-                except db.IntegrityError:
-                    # Game already exists, update it
-                    db.execute(
-                        'UPDATE game SET name = ?, playtime_forever = ?,'
-                        ' img_icon_url = ?, img_logo_url = ? WHERE appid = ? AND platform = ?',
-                        (name, playtime, img_icon_url, img_logo_url, str(appid), 'steam')
-                    )
-                    updated_count += 1
-                else:
-                    imported_count += 1
-                
-                # Get game ID
-                game = db.execute(
-                    'SELECT id FROM game WHERE appid = ? AND platform = ?', (str(appid), 'steam')
-                ).fetchone()
-                
-                # Store game info for background tag fetching
-                if tag_fetch_enabled:
-                    games_to_tag.append({
-                        'game_id': game['id'],
-                        'appid': appid
-                    })
-                
-                # Insert or update user_game_library
-                try:
-                    db.execute(
-                        'INSERT INTO user_game_library (user_id, game_id, playtime_forever)'
-                        ' VALUES (?, ?, ?)',
-                        (g.user['id'], game['id'], playtime)
-                    )
-                except db.IntegrityError:
-                    # Already in library, update playtime
-                    db.execute(
-                        'UPDATE user_game_library SET playtime_forever = ?,'
-                        ' imported_at = CURRENT_TIMESTAMP'
-                        ' WHERE user_id = ? AND game_id = ?',
-                        (playtime, g.user['id'], game['id'])
-                    )
+            # One row per appid; malformed entries without an appid are dropped
+            unique_games = {
+                str(game_data['appid']): game_data
+                for game_data in games if isinstance(game_data, dict) and game_data.get('appid')
+            }
+            game_rows = [
+                (appid, game_data.get('name', 'Unknown Game'), game_data.get('playtime_forever', 0),
+                 game_data.get('img_icon_url', ''), game_data.get('img_logo_url', ''))
+                for appid, game_data in unique_games.items()
+            ]
+            appids = list(unique_games)
+            
+            # Write the whole import in one transaction
+            db.execute('BEGIN IMMEDIATE')
+            
+            # Lookups and upserts go in chunks to stay under SQLite's bound-parameter limit
+            existing = set()
+            for start in range(0, len(appids), _UPSERT_CHUNK):
+                chunk = appids[start:start + _UPSERT_CHUNK]
+                existing.update(row['appid'] for row in db.execute(
+                    f"SELECT appid FROM game WHERE appid IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall())
+            imported_count = len(appids) - len(existing)
+            updated_count = len(game_rows) - imported_count
+            
+            # Insert or update games, collecting their IDs from RETURNING
+            game_ids = {}
+            for start in range(0, len(game_rows), _UPSERT_CHUNK):
+                chunk = game_rows[start:start + _UPSERT_CHUNK]
+                game_ids.update((row['appid'], row['id']) for row in db.execute(
+                    'INSERT INTO game (appid, name, platform, playtime_forever, img_icon_url, img_logo_url)'
+                    ' VALUES ' + ','.join(["(?, ?, 'steam', ?, ?, ?)"] * len(chunk)) +
+                    ' ON CONFLICT (appid) DO UPDATE SET name = excluded.name, playtime_forever = excluded.playtime_forever,'
+                    ' img_icon_url = excluded.img_icon_url, img_logo_url = excluded.img_logo_url'
+                    ' WHERE platform = excluded.platform'
+                    ' RETURNING id, appid',
+                    [value for row in chunk for value in row]
+                ).fetchall())
+            
+            # Insert or update user_game_library
+            db.executemany(
+                _SQL_UPSERT_LIBRARY,
+                [(g.user['id'], game_ids[appid], playtime) for appid, _, playtime, _, _ in game_rows if appid in game_ids]
+            )
             
             db.commit()
+            cache.delete(recommendations_key(g.user['id']))
             
-            # Start background thread to fetch tags
+            # Store game info for background tag fetching, skipping games
+            # already tagged by an earlier import
+            games_to_tag = []
+            if tag_fetch_enabled:
+                tagged_ids = {row['game_id'] for row in db.execute(_SQL_TAGGED_LIBRARY_GAMES, (g.user['id'],))}
+                games_to_tag = [
+                    {'game_id': game_id, 'appid': appid}
+                    for appid, game_id in game_ids.items() if game_id not in tagged_ids
+                ]
+            
+            # Hand the games to the background tagger
             if tag_fetch_enabled and games_to_tag:
-                thread = threading.Thread(
-                    target=fetch_tags_background,
-                    args=(current_app._get_current_object(), games_to_tag),
-                    daemon=True
-                )
-                thread.start()
+                enqueue_tag_fetch(games_to_tag)
                 message = f'Successfully imported {imported_count} new games and updated {updated_count} existing games! Tags are being fetched in the background.'
             else:
                 message = f'Successfully imported {imported_count} new games and updated {updated_count} existing games!'
@@ -420,37 +668,43 @@ def library():
     sort_order = request.args.get('order', 'asc')
     
     # Validate sort parameters
-    valid_sorts = {
-        'name': 'g.name',
-        'playtime': 'ugl.playtime_forever',
-        'imported': 'ugl.imported_at'
-    }
-    valid_orders = ['asc', 'desc']
-    
-    if sort_by not in valid_sorts:
+    if sort_by not in _LIBRARY_SORTS:
         sort_by = 'name'
-    if sort_order not in valid_orders:
+    if sort_order not in _SORT_ORDERS:
         sort_order = 'asc'
     
-    # Build ORDER BY clause safely using whitelist
-    order_column = valid_sorts[sort_by]
-    order_direction = sort_order.upper()
-    order_clause = f"{order_column} {order_direction}"
+    # Get highlighted game ID from query parameter
+    highlight_id = request.args.get('highlight', type=int)
+    
+    total = db.execute(_SQL_COUNT_LIBRARY, (g.user['id'],)).fetchone()[0]
+    page_count = max(1, -(-total // PER_PAGE))
+    
+    page = request.args.get('page', type=int)
+    if page is None and highlight_id is not None:
+        # Open the page that contains the highlighted game
+        position = db.execute(
+            _LIBRARY_POSITION_QUERIES[(sort_by, sort_order)],
+            (g.user['id'], highlight_id)
+        ).fetchone()
+        if position is not None:
+            page = (position['position'] - 1) // PER_PAGE + 1
+    page = min(max(page or 1, 1), page_count)
     
     games = db.execute(
-        'SELECT g.id, g.appid, g.name, g.platform, g.playtime_forever, g.img_icon_url, g.img_logo_url,'
-        ' ugl.imported_at, ugl.playtime_forever as user_playtime'
-        ' FROM user_game_library ugl'
-        ' JOIN game g ON ugl.game_id = g.id'
-        ' WHERE ugl.user_id = ?'
-        f' ORDER BY {order_clause}',
-        (g.user['id'],)
+        _LIBRARY_QUERIES[(sort_by, sort_order)],
+        (g.user['id'], PER_PAGE, (page - 1) * PER_PAGE)
     ).fetchall()
     
-    # Get highlighted game ID from query parameter
-    highlight_id = request.args.get('highlight', type=int)
-    
-    return render_template('steam/library.html', games=games, sort_by=sort_by, sort_order=sort_order, highlight_id=highlight_id)
+    return render_template(
+        'steam/library.html',
+        games=games,
+        total=total,
+        page=page,
+        page_count=page_count,
+        sort_by=sort_by,
+        sort_order=sort_order,
+        highlight_id=highlight_id
+    )
 
 
 @bp.route('/library/random')
@@ -459,21 +713,13 @@ def random_game():
     """Select a random game from user's library."""
     db = get_db()
     
-    games = db.execute(
-        'SELECT g.id, g.appid, g.name'
-        ' FROM user_game_library ugl'
-        ' JOIN game g ON ugl.game_id = g.id'
-        ' WHERE ugl.user_id = ?',
-        (g.user['id'],)
-    ).fetchall()
+    # Let SQLite pick the row so only one game is fetched
+    selected_game = db.execute(_SQL_RANDOM_GAME, (g.user['id'],)).fetchone()
     
-    if not games:
+    if selected_game is None:
         flash('Your library is empty. Import games first!')
         return redirect(url_for('steam.library'))
     
-    # Select a random game
-    selected_game = random.choice(games)
-    
     # Flash message with the selected game
     flash(f"🎲 Random game selected: {selected_game['name']}")
     
@@ -491,6 +737,7 @@ def remove_game(game_id):
         (g.user['id'], game_id)
     )
     db.commit()
+    cache.delete(recommendations_key(g.user['id']))
     flash('Game removed from your library.')
     return redirect(url_for('steam.library'))
 
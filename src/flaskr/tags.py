@@ -0,0 +1,10 @@
+# Common game tags/genres, in display order; the set is for membership checks.
+# Kept outside the recommendations blueprint so the Steam tagger can use them
+# when recommendations are disabled.
+POPULAR_TAGS = (
+    'Action', 'Adventure', 'RPG', 'Strategy', 'Simulation', 'Sports',
+    'Racing', 'Puzzle', 'Indie', 'Casual', 'Multiplayer', 'Singleplayer',
+    'FPS', 'Horror', 'Sci-Fi', 'Fantasy', 'Open World', 'Story Rich',
+    'Co-op', 'Competitive', 'Sandbox', 'Survival', 'Crafting', 'Building'
+)
+POPULAR_TAGS_SET = frozenset(POPULAR_TAGS)
@@ -4,6 +4,7 @@ import tempfile
 import pytest
 from flaskr import create_app
 from flaskr.db import get_db, init_db
+from flaskr.db_pool import get_pool
 
 with open(os.path.join(os.path.dirname(__file__), 'data.sql'), 'rb') as f:
     _data_sql = f.read().decode('utf8')
@@ -24,6 +25,7 @@ def app():
 
     yield app
 
+    get_pool(app).close()
     os.close(db_fd)
     os.unlink(db_path)
 
@@ -54,3 +56,19 @@ class AuthActions(object):
 @pytest.fixture
 def auth(client):
     return AuthActions(client)
+
+
+@pytest.fixture
+def shared_library(app):
+    """User 1 owns games 1-120 and user 2 owns the odd-numbered ones."""
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            'INSERT INTO game (id, name, appid) VALUES (?, ?, ?)',
+            [(i, f'Game {i:03}', str(i)) for i in range(1, 121)]
+        )
+        db.executemany(
+            'INSERT INTO user_game_library (user_id, game_id, playtime_forever) VALUES (?, ?, ?)',
+            [(1, i, i) for i in range(1, 121)] + [(2, i, i) for i in range(1, 121, 2)]
+        )
+        db.commit()
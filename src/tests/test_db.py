@@ -9,10 +9,27 @@ def test_get_close_db(app):
         db = get_db()
         assert db is get_db()
 
-    with pytest.raises(sqlite3.ProgrammingError) as e:
-        db.execute('SELECT 1')
+    # Released back to the pool rather than closed, and reused next time
+    with app.app_context():
+        assert get_db() is db
+        assert db.execute('SELECT 1').fetchone()[0] == 1
+
+
+def test_read_only_requests(app):
+    with app.test_request_context('/', method='GET'):
+        with pytest.raises(sqlite3.OperationalError):
+            get_db().execute('DELETE FROM user')
 
-    assert 'closed' in str(e.value)
+    with app.test_request_context('/', method='POST'):
+        assert get_db().execute('PRAGMA query_only').fetchone()[0] == 0
+
+
+def test_connection_pragmas(app):
+    with app.app_context():
+        db = get_db()
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert db.execute('PRAGMA synchronous').fetchone()[0] == 1
+        assert db.execute('PRAGMA foreign_keys').fetchone()[0] == 1
 
 def test_init_db_command(runner, monkeypatch):
     class Recorder(object):
@@ -24,4 +41,17 @@ def test_init_db_command(runner, monkeypatch):
     monkeypatch.setattr('flaskr.db.init_db', fake_init_db)
     result = runner.invoke(args=['init-db'])
     assert 'Initialized' in result.output
-    assert Recorder.called
\ No newline at end of file
+    assert Recorder.called
+
+def test_schema_upgraded_on_existing_db(app):
+    with app.app_context():
+        get_db().execute('DROP TABLE steam_tag_cache')
+        get_db().execute('DROP INDEX idx_game_tag_tag')
+        get_db().commit()
+
+    app.extensions.pop('db_pool').close()
+    with app.app_context():
+        assert get_db().execute('SELECT COUNT(*) FROM steam_tag_cache').fetchone()[0] == 0
+        assert get_db().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'idx_game_tag_tag'"
+        ).fetchone() is not None
@@ -0,0 +1,139 @@
+import json
+
+import pytest
+import requests
+from flaskr import epic
+from flaskr.cache import cache, recommendations_key
+from flaskr.db import get_db
+from flaskr.epic import _persist_games, parse_epic_manifest
+
+OFFER_ID = '0123456789abcdef0123456789abcdef'
+
+
+@pytest.mark.parametrize('manifest_data', (
+        [{'AppName': 'Fortnite', 'AppId': 'fn'}],
+        {'games': [{'AppName': 'Fortnite', 'AppId': 'fn'}]},
+        {'other': [{'AppName': 'Fortnite', 'AppId': 'fn'}]},
+        json.dumps([{'AppName': 'Fortnite', 'AppId': 'fn'}]),
+        json.dumps([{'AppName': 'Fortnite', 'AppId': 'fn'}]).encode(),
+        '\n  ' + json.dumps({'games': [{'AppName': 'Fortnite', 'AppId': 'fn'}]}),
+))
+def test_parse_manifest_formats(manifest_data):
+    games = parse_epic_manifest(manifest_data)
+    assert [(game['name'], game['app_id']) for game in games] == [('Fortnite', 'fn')]
+
+
+def test_parse_manifest_images():
+    games = parse_epic_manifest([
+        {'title': 'Wide', 'offerId': OFFER_ID, 'keyImages': [
+            {'type': 'Thumbnail', 'url': 'https://example.com/thumb.png'},
+            {'type': 'OfferImageWide', 'url': 'https://example.com/wide.png'},
+        ]},
+        {'title': 'Plain', 'image': 'https://example.com/plain.png'},
+        {'title': 'Nested', 'image': {'url': 'https://example.com/nested.png'}},
+    ])
+    assert [(game['name'], game['image_url']) for game in games] == [
+        ('Wide', 'https://example.com/wide.png'),
+        ('Plain', 'https://example.com/plain.png'),
+        ('Nested', None),
+    ]
+    assert games[0]['offer_id'] == OFFER_ID
+
+
+def test_parse_manifest_text():
+    manifest_text = (
+        '# exported library\n'
+        '"AppName": "Fortnite", "CatalogItemId": "abc", "DisplayName": "Fortnite Battle Royale"\n'
+        '"AppNameId": "skipped", "title": "Alan Wake"\n'
+        '\n'
+    )
+    games = parse_epic_manifest(manifest_text)
+    assert [game['name'] for game in games] == ['Fortnite', 'Fortnite Battle Royale', 'Alan Wake']
+    assert parse_epic_manifest(manifest_text.encode()) == games
+
+
+@pytest.mark.parametrize('manifest_data', (
+        '',
+        '[not json',
+        '{"games": [{"id": "no-name"}]}',
+        [],
+))
+def test_parse_manifest_empty(manifest_data):
+    assert parse_epic_manifest(manifest_data) is None
+
+
+def test_persist_manifest_with_numeric_id(app):
+    games = parse_epic_manifest('[{"name": "X", "id": 5}, {"name": "Y", "offerId": 6}]')
+    assert [(game['app_id'], game['offer_id']) for game in games] == [('5', '5'), (None, '6')]
+
+    with app.test_request_context(method='POST'):
+        assert _persist_games(games, 1) == (2, 0)
+        rows = get_db().execute("SELECT appid, name FROM game WHERE platform = 'epic' ORDER BY appid").fetchall()
+    assert [tuple(row) for row in rows] == [('5', 'X'), ('6', 'Y')]
+
+
+def test_persist_clears_recommendations(app):
+    with app.test_request_context(method='POST'):
+        cache.set(recommendations_key(1), ['stale'])
+        _persist_games([{'name': 'X'}], 1)
+        assert cache.get(recommendations_key(1)) is None
+
+
+class FakeResponse(object):
+
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(response=self)
+
+
+def test_access_token_cached_and_refreshed_on_401(app, monkeypatch):
+    app.config.update(EPIC_CLIENT_ID='id', EPIC_CLIENT_SECRET='secret')
+    tokens = iter(['revoked', 'fresh'])
+    used = []
+
+    def fake_post(url, headers=None, data=None, timeout=None):
+        return FakeResponse({'access_token': next(tokens), 'expires_in': 3600})
+
+    def fake_get(url, headers=None, params=None, timeout=None):
+        used.append(headers['Authorization'])
+        if headers['Authorization'] == 'Bearer revoked':
+            return FakeResponse({}, 401)
+        return FakeResponse({'items': [{'type': 'ENTITLEMENT', 'offer': {'id': OFFER_ID, 'title': 'X'}}]})
+
+    monkeypatch.setattr(epic, '_TOKEN_CACHE', {})
+    monkeypatch.setattr(epic._SESSION, 'post', fake_post)
+    monkeypatch.setattr(epic._SESSION, 'get', fake_get)
+    with app.app_context():
+        assert epic.get_epic_access_token() == ('revoked', None)
+        # Served from the cache until the API rejects it
+        assert epic.get_epic_access_token() == ('revoked', None)
+        games, error = epic.fetch_epic_library('account', 'revoked')
+        assert error is None
+        assert [game['offer_id'] for game in games] == [OFFER_ID]
+        assert epic.get_epic_access_token() == ('fresh', None)
+    assert used == ['Bearer revoked', 'Bearer fresh']
+
+
+def test_persist_games_upserts(app):
+    with app.test_request_context(method='POST'):
+        db = get_db()
+        db.execute("INSERT INTO game (name, appid, platform) VALUES ('Steam game', 'clash', 'steam')")
+        db.commit()
+        assert _persist_games([{'name': 'A', 'app_id': 'a'}, {'name': 'Clash', 'app_id': 'clash'}], 1) == (1, 1)
+        assert _persist_games([{'name': 'A renamed', 'app_id': 'a'}], 1) == (0, 1)
+        assert _persist_games([{'name': 'A renamed', 'app_id': 'a'}], 2) == (0, 1)
+        games = db.execute('SELECT appid, name, platform FROM game ORDER BY appid').fetchall()
+        library = db.execute(
+            'SELECT ugl.user_id, g.appid FROM user_game_library ugl'
+            ' JOIN game g ON g.id = ugl.game_id ORDER BY ugl.user_id'
+        ).fetchall()
+    # A Steam game with the same appid is left alone and kept out of the Epic import
+    assert [tuple(row) for row in games] == [('a', 'A renamed', 'epic'), ('clash', 'Steam game', 'steam')]
+    assert [tuple(row) for row in library] == [(1, 'a'), (2, 'a')]
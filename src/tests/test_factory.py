@@ -7,4 +7,13 @@ def test_config():
 
 def test_hello(client):
     response = client.get('/hello')
-    assert response.data == b'Hello, World!'
\ No newline at end of file
+    assert response.data == b'Hello, World!'
+
+
+def test_index_redirect(client, auth):
+    response = client.get('/')
+    assert response.status_code == 302
+    assert response.headers['Location'] == '/auth/login'
+
+    auth.login()
+    assert client.get('/').headers['Location'] == '/steam/library'
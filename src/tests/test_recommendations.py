@@ -0,0 +1,51 @@
+from flaskr.cache import cache, recommendations_key
+from flaskr.db import get_db
+from flaskr.recommendations import _build_recommendations
+
+
+def _add_candidates(db):
+    """Games 1-3 are candidates for user 1; game 4 is owned and game 5 untagged."""
+    db.executemany(
+        'INSERT INTO game (id, name, appid) VALUES (?, ?, ?)',
+        [(i, f'Game {i}', str(i)) for i in range(1, 6)]
+    )
+    db.executemany(
+        'INSERT INTO game_tag (game_id, tag) VALUES (?, ?)',
+        [(1, 'Action'), (1, 'RPG'), (2, 'Action'), (4, 'Action')]
+    )
+    db.executemany(
+        'INSERT INTO user_game_library (user_id, game_id, playtime_forever) VALUES (?, ?, 0)',
+        [(1, 4), (2, 2), (2, 3), (2, 4)]
+    )
+    db.execute('INSERT INTO user_follows (follower_id, following_id) VALUES (1, 2)')
+    db.executemany(
+        'INSERT INTO user_preferences (user_id, tag, weight) VALUES (1, ?, 1.0)',
+        [('Action',), ('RPG',)]
+    )
+    db.commit()
+
+
+def test_build_recommendations(app):
+    with app.app_context():
+        db = get_db()
+        assert _build_recommendations(db, 1) == ([], False)
+        _add_candidates(db)
+        recommendations, has_preferences = _build_recommendations(db, 1)
+    assert has_preferences
+    assert [(rec['game']['id'], rec['score'], rec['reason']) for rec in recommendations] == [
+        (2, 6, 'Matches your tags: Action; Also played by followed users'),
+        (3, 5, 'Played by followed users'),
+        (1, 2, 'Matches your tags: Action, RPG'),
+    ]
+
+
+def test_recommendations_cached_until_preferences_change(client, auth, app):
+    with app.app_context():
+        _add_candidates(get_db())
+    auth.login()
+    assert 'Matches your tags: Action' in client.get('/recommendations/').get_data(as_text=True)
+    assert cache.get(recommendations_key(1)) is not None
+
+    client.post('/recommendations/preferences', data={'tags': ['RPG']})
+    assert cache.get(recommendations_key(1)) is None
+    assert 'Matches your tags: Action' not in client.get('/recommendations/').get_data(as_text=True)
@@ -0,0 +1,24 @@
+import re
+
+import pytest
+
+
+@pytest.mark.parametrize(('query', 'page', 'count'), (
+        ('?sort=name&order=asc', 'Page 1 of 2', 50),
+        ('?sort=name&order=asc&page=2', 'Page 2 of 2', 10),
+        ('?sort=name&order=asc&page=99', 'Page 2 of 2', 10),
+))
+def test_common_games_pagination(client, auth, shared_library, query, page, count):
+    auth.login()
+    html = client.get('/social/common-games/2' + query).get_data(as_text=True)
+    assert '<strong>60</strong> games in common' in html
+    assert page in html
+    assert len(re.findall(r'<article', html)) == count
+
+
+def test_common_games_relevance(client, auth, shared_library):
+    auth.login()
+    # Pooled connections keep relevance registered across requests
+    for _ in range(2):
+        html = client.get('/social/common-games/2').get_data(as_text=True)
+        assert html.index('Game 119') < html.index('Game 117')
@@ -0,0 +1,197 @@
+import re
+
+import pytest
+from flaskr import steam
+from flaskr.db import get_db
+
+
+class FakeResponse(object):
+    status_code = 200
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.mark.parametrize(('steam_id_input', 'expected'), (
+        ('76561197960287930', '76561197960287930'),
+        ('https://steamcommunity.com/profiles/76561197960287930/', '76561197960287930'),
+        ('HTTPS://SteamCommunity.com/Profiles/76561197960287930', '76561197960287930'),
+))
+def test_resolve_steam_id(app, steam_id_input, expected):
+    app.config['STEAM_API_KEY'] = 'key'
+    with app.app_context():
+        assert steam.resolve_steam_id(steam_id_input) == (expected, None)
+
+
+def test_resolve_steam_id_short(app):
+    app.config['STEAM_API_KEY'] = 'key'
+    with app.app_context():
+        steam_id, error = steam.resolve_steam_id('12345')
+    assert steam_id is None
+    assert '17 digits' in error
+
+
+def test_resolve_steam_id_vanity(app, monkeypatch):
+    app.config['STEAM_API_KEY'] = 'key'
+    requested = []
+
+    def fake_get(url, params=None, timeout=None):
+        requested.append(params['vanityurl'])
+        if params['vanityurl'] == 'someone':
+            return FakeResponse(b'{"response": {"success": 1, "steamid": "76561197960287930"}}')
+        return FakeResponse(b'{"response": {"success": 42}}')
+
+    monkeypatch.setattr(steam._SESSION, 'get', fake_get)
+    with app.app_context():
+        assert steam.resolve_steam_id('https://steamcommunity.com/id/SomeOne/') == ('76561197960287930', None)
+        # Lookups are cached under the lowercased name
+        assert steam.resolve_steam_id('someone') == ('76561197960287930', None)
+        steam_id, error = steam.resolve_steam_id('nobody')
+    assert steam_id is None
+    assert 'not found' in error
+    assert requested == ['someone', 'nobody']
+
+
+def test_resolve_steam_id_non_ascii_digits(app, monkeypatch):
+    app.config['STEAM_API_KEY'] = 'key'
+    requested = []
+
+    def fake_get(url, params=None, timeout=None):
+        requested.append(params['vanityurl'])
+        return FakeResponse(b'{"response": {"success": 42}}')
+
+    monkeypatch.setattr(steam._SESSION, 'get', fake_get)
+    with app.app_context():
+        # Not a Steam ID64, so it goes to the vanity lookup
+        steam_id, error = steam.resolve_steam_id('١' * 17)
+    assert steam_id is None
+    assert 'not found' in error
+    assert requested == ['١' * 17]
+
+
+def test_resolve_steam_id_bad_body(app, monkeypatch):
+    app.config['STEAM_API_KEY'] = 'key'
+    monkeypatch.setattr(steam._SESSION, 'get', lambda *args, **kwargs: FakeResponse(b'<html></html>'))
+    with app.app_context():
+        steam_id, error = steam.resolve_steam_id('someone')
+    assert steam_id is None
+    assert error.startswith('Error connecting to Steam API')
+
+
+class RateLimitedResponse(FakeResponse):
+    status_code = 429
+
+    def __init__(self, retry_after=None):
+        super().__init__(b'')
+        self.headers = {'Retry-After': retry_after} if retry_after else {}
+
+
+@pytest.mark.parametrize(('retry_after', 'expected'), (
+        (None, None),
+        ('7', 7),
+        ('soon', None),
+        ('Wed, 21 Oct 2015 07:28:00 GMT', 0),
+))
+def test_retry_after_seconds(retry_after, expected):
+    assert steam._retry_after_seconds(RateLimitedResponse(retry_after)) == expected
+
+
+def test_game_details_backs_off_on_429(app, monkeypatch):
+    responses = iter([
+        RateLimitedResponse('7'),
+        RateLimitedResponse(),
+        FakeResponse(b'{"99": {"success": true, "data": {"name": "X"}}}'),
+    ])
+    sleeps = []
+    monkeypatch.setattr(steam._SESSION, 'get', lambda *args, **kwargs: next(responses))
+    monkeypatch.setattr(steam.time, 'sleep', sleeps.append)
+    with app.app_context():
+        assert steam.get_game_details('99') == {'name': 'X'}
+    # Retry-After is honoured, otherwise the wait is jittered within the cap
+    assert sleeps[0] == 7
+    assert steam._BACKOFF_BASE <= sleeps[1] <= steam._BACKOFF_CAP
+
+
+@pytest.mark.parametrize(('game_details', 'tags'), (
+        (None, []),
+        ({}, []),
+        ({'genres': [], 'categories': []}, []),
+        ({'genres': [{'description': 'Action'}, {'description': 'ACTION'}, {'description': 'Unknown'}],
+          'categories': [{'description': 'Single-player'}, {'description': 'Online Co-op'}]},
+         ['Action', 'Singleplayer', 'Co-op']),
+))
+def test_tags_from_game_details(game_details, tags):
+    assert steam.tags_from_game_details(game_details) == tags
+
+
+def test_tag_games(app, monkeypatch):
+    details = {
+        '10': {'genres': [{'description': 'Action'}], 'categories': [{'description': 'Single-player'}]},
+        '20': None,
+        '30': {'genres': [{'description': 'Unknown'}]},
+    }
+    requested = []
+
+    def fake_details(appid):
+        requested.append(appid)
+        return details[appid]
+
+    monkeypatch.setattr(steam, 'get_game_details', fake_details)
+    games = [{'game_id': i, 'appid': str(i * 10)} for i in (1, 2, 3)]
+    with app.app_context():
+        db = get_db()
+        db.executemany('INSERT INTO game (id, name, appid) VALUES (?, ?, ?)', [(i, f'Game {i}', str(i * 10)) for i in (1, 2, 3)])
+        db.commit()
+        steam.tag_games(db, games)
+        # Every outcome is cached, failed lookups as NULL, so nothing is fetched twice
+        steam.tag_games(db, games)
+        tags = db.execute('SELECT game_id, tag FROM game_tag ORDER BY game_id, tag').fetchall()
+        cached = db.execute('SELECT appid, tags FROM steam_tag_cache ORDER BY appid').fetchall()
+    assert [tuple(row) for row in tags] == [(1, 'Action'), (1, 'Singleplayer')]
+    assert [tuple(row) for row in cached] == [('10', '["Action", "Singleplayer"]'), ('20', None), ('30', '[]')]
+    assert sorted(requested) == ['10', '20', '30']
+
+
+def test_import_dedupes_games(client, auth, app, monkeypatch):
+    games = [
+        {'appid': 10, 'name': 'Old name', 'playtime_forever': 1},
+        {'appid': 10, 'name': 'New name', 'playtime_forever': 2},
+        {'name': 'No appid'},
+        'junk',
+        {'appid': 20, 'name': 'Other'},
+    ]
+    queued = []
+    monkeypatch.setattr(steam, 'resolve_steam_id', lambda steam_id: ('76561197960287930', None))
+    monkeypatch.setattr(steam, 'fetch_steam_library', lambda steam_id: (games, None))
+    monkeypatch.setattr(steam, 'enqueue_tag_fetch', queued.extend)
+
+    auth.login()
+    response = client.post('/steam/import', data={'steam_id': 'someone'})
+    assert response.headers['Location'] == '/steam/library'
+
+    with app.app_context():
+        rows = get_db().execute(
+            'SELECT g.appid, g.name, ugl.playtime_forever FROM game g'
+            ' JOIN user_game_library ugl ON ugl.game_id = g.id ORDER BY g.appid'
+        ).fetchall()
+    assert [tuple(row) for row in rows] == [('10', 'New name', 2), ('20', 'Other', 0)]
+    assert sorted(game['appid'] for game in queued) == ['10', '20']
+
+
+@pytest.mark.parametrize(('query', 'page', 'game_ids'), (
+        ('', 'Page 1 of 3', range(1, 51)),
+        ('?page=3', 'Page 3 of 3', range(101, 121)),
+        ('?page=99', 'Page 3 of 3', range(101, 121)),
+        ('?highlight=77', 'Page 2 of 3', range(51, 101)),
+        ('?sort=playtime&order=desc&highlight=77', 'Page 1 of 3', range(120, 70, -1)),
+))
+def test_library_pagination(client, auth, shared_library, query, page, game_ids):
+    auth.login()
+    html = client.get('/steam/library' + query).get_data(as_text=True)
+    assert 'You have 120 games' in html
+    assert page in html
+    assert [int(game_id) for game_id in re.findall(r'id="game-(\d+)"', html)] == list(game_ids)